@@ -0,0 +1,193 @@
+""" シーン × 粒子数 × グリッドサイズ × バックエンド × 精度の組み合わせで1ステップの速さを測るベンチマーク
+
+各組み合わせについて、フェーズごと（P2G, グリッド更新, G2P, 衝突, 描画など）の
+1ステップあたりの時間と particle-steps/s を JSON に書き出す。
+バージョン間で比べるときは --compare に前の結果を渡す。
+
+使い方:
+    python src/bench.py --quick --output bench.json
+    python src/bench.py --scenes elasticity --particles 1000 10000 --grids 32 64 --backends numpy jit
+    python src/bench.py --scenes only_gravity --dtypes float64 float32
+    python src/bench.py --output new.json --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import time
+
+import numpy as np
+
+import headless
+import instrument
+import jit
+from render import RasterRenderer
+
+# バックエンド名 -> シミュレーションに渡す引数
+MPM_BACKENDS = {
+    "numpy": dict(backend="numpy", sparse_block_size=None),
+    "numpy-sparse": dict(backend="numpy", sparse_block_size=8),
+    "jit": dict(backend="jit", sparse_block_size=None),
+    "numpy-implicit": dict(backend="numpy", implicit=True),
+}
+DEM_BACKENDS = {
+    "verlet": dict(collision_method="verlet"),
+    "spatial_hash": dict(collision_method="spatial_hash"),
+    "brute_force": dict(collision_method="brute_force"),
+}
+BRUTE_FORCE_MAX = 1000  # 全ペア探索はこの粒子数までしか測らない
+
+# シーン名 -> (バックエンド, グリッドサイズと精度を変えられるか)
+SCENE_OPTIONS = {
+    "only_gravity": (MPM_BACKENDS, True),
+    "elasticity": (MPM_BACKENDS, True),
+    "dem": (DEM_BACKENDS, False),
+}
+DEFAULT_DTYPES = ["float64"]
+
+# 既定の組み合わせ（--quick は小さい方）
+DEFAULT_PARTICLES = {"only_gravity": [10_000, 100_000, 1_000_000], "elasticity": [1_000, 10_000, 100_000],
+                     "dem": [30, 300, 3_000]}
+QUICK_PARTICLES = {"only_gravity": [10_000], "elasticity": [1_000], "dem": [30]}
+DEFAULT_GRIDS = [32, 128]
+QUICK_GRIDS = [32]
+
+RENDER_SIZE = 800   # 描画フェーズを測るときの画像の大きさ（ピクセル）
+RENDER_RADIUS_PX = 5
+
+
+def measure(scene, n_particles, n_grid, backend, dtype=None, steps=20, warmup=3, render_frames=5, seed=0):
+    """ 1つの組み合わせを測り、結果の辞書を返す """
+    backends, has_grid = SCENE_OPTIONS[scene]
+    options = dict(backends[backend])
+    if has_grid:
+        options["n_grid_side"] = n_grid
+        options["dtype"] = dtype
+    random.seed(seed)
+    sim = headless.create_simulation(scene, n_particles, **options)
+    # JITのコンパイルや最初の並べ替えは測らない
+    sim.step(warmup)
+
+    # フェーズごとの時間はシミュレーションの PHASES のメソッドを差し替えて測る
+    timers = instrument.PhaseTimers()
+    timers.attach(sim, sim.PHASES)
+    sim_start = sim.time
+    start = time.perf_counter()
+    sim.step(steps)
+    elapsed = time.perf_counter() - start
+    sim_time = sim.time - sim_start
+    timers.detach()
+    totals = dict(timers.totals)
+    totals.pop("step", None)
+    totals["other"] = max(elapsed - sum(totals.values()), 0.0)
+
+    renderer = RasterRenderer(RENDER_SIZE, RENDER_SIZE, particle_radius_px=RENDER_RADIUS_PX)
+    start = time.perf_counter()
+    for _ in range(render_frames):
+        renderer.render(sim.positions())
+    render_time = (time.perf_counter() - start) / max(render_frames, 1)
+    if hasattr(sim, "close"):
+        sim.close()
+
+    n = sim.num_particles()
+    return {
+        "scene": scene, "n_particles": n, "n_grid": n_grid if has_grid else None, "backend": backend,
+        "dtype": dtype if has_grid else None,
+        "steps": steps, "elapsed": elapsed, "steps_per_sec": steps / elapsed,
+        "particle_steps_per_sec": steps * n / elapsed,
+        # 陰解法は1ステップが重い代わりに dt が大きいので、シミュレーション時間の進み方でも比べる
+        "sim_time_per_sec": sim_time / elapsed,
+        # 1ステップあたりの秒数（描画は1フレームあたり）
+        "phases": dict({k: v / steps for k, v in totals.items()}, render=render_time),
+    }
+
+
+def configurations(scenes, particles, grids, backends, dtypes):
+    """ 測る組み合わせ (シーン, 粒子数, グリッドサイズ, バックエンド, 精度) を並べる """
+    for scene in scenes:
+        scene_backends, has_grid = SCENE_OPTIONS[scene]
+        for n in particles.get(scene, []):
+            for n_grid in (grids if has_grid else [None]):
+                for backend in scene_backends:
+                    if backends and backend not in backends:
+                        continue
+                    if backend == "jit" and not jit.AVAILABLE:
+                        continue
+                    if backend == "brute_force" and n > BRUTE_FORCE_MAX:
+                        continue
+                    for dtype in (dtypes if has_grid else [None]):
+                        yield scene, n, n_grid, backend, dtype
+
+
+def environment():
+    """ 結果と一緒に残す実行環境の情報 """
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit, "python": platform.python_version(), "numpy": np.__version__,
+        "numba": jit.numba.__version__ if jit.AVAILABLE else None,
+        "machine": platform.machine(), "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def result_key(r):
+    return r["scene"], r["n_particles"], r["n_grid"], r["backend"], r.get("dtype")
+
+
+def compare(results, baseline):
+    """ 前の結果と同じ組み合わせについて、particle-steps/s の比を表示する """
+    old = {result_key(r): r for r in baseline["results"]}
+    for r in results:
+        b = old.get(result_key(r))
+        if b is not None:
+            ratio = r["particle_steps_per_sec"] / b["particle_steps_per_sec"]
+            print(f"{r['scene']:>12} N={r['n_particles']:<8} grid={r['n_grid']!s:<4} {r['backend']:<13}"
+                  f" {r.get('dtype')!s:<8} x{ratio:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="シミュレーションのステップの速さを測る")
+    parser.add_argument("--scenes", nargs="+", default=list(SCENE_OPTIONS), choices=list(SCENE_OPTIONS))
+    parser.add_argument("--particles", nargs="+", type=int, default=None,
+                        help="粒子数（省略時はシーンごとの既定値）")
+    parser.add_argument("--grids", nargs="+", type=int, default=None, help="MPMの各軸の格子点数")
+    parser.add_argument("--backends", nargs="+", default=None, help="測るバックエンド（省略時はすべて）")
+    parser.add_argument("--dtypes", nargs="+", default=DEFAULT_DTYPES, choices=("float64", "float32"),
+                        help="MPMの浮動小数点の型")
+    parser.add_argument("--steps", type=int, default=20, help="1つの組み合わせで測るステップ数")
+    parser.add_argument("--quick", action="store_true", help="小さい組み合わせだけ測る")
+    parser.add_argument("--output", default=None, help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", default=None, help="比べる前回の結果（JSON）")
+    args = parser.parse_args(argv)
+
+    particles = QUICK_PARTICLES if args.quick else DEFAULT_PARTICLES
+    if args.particles is not None:
+        particles = {scene: args.particles for scene in args.scenes}
+    grids = args.grids or (QUICK_GRIDS if args.quick else DEFAULT_GRIDS)
+
+    results = []
+    for scene, n, n_grid, backend, dtype in configurations(args.scenes, particles, grids, args.backends,
+                                                           args.dtypes):
+        r = measure(scene, n, n_grid, backend, dtype, steps=args.steps)
+        results.append(r)
+        phases = "  ".join(f"{k}: {v * 1e3:.2f}" for k, v in r["phases"].items())
+        print(f"{scene:>12} N={r['n_particles']:<8} grid={r['n_grid']!s:<4} {backend:<13} {dtype!s:<8}"
+              f" {r['particle_steps_per_sec']:.3e} particle-steps/s  [ms] {phases}")
+
+    report = {"environment": environment(), "results": results}
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+""" シミュレーションの状態をディレクトリに保存・復元する（チェックポイント）
+
+ディレクトリの中身は header.json（設定・ステップ数・時刻・乱数の状態）と
+配列ごとの .npy ファイル。復元時は .npy をコピーオンライトでメモリマップするので、
+何GBあっても読み込みはすぐに終わり、実際に触ったページだけがメモリに載る
+（書き換えてもファイルは変わらない）。
+"""
+import json
+import os
+import random
+import shutil
+import tempfile
+
+import numpy as np
+
+import jit
+from dem import DEMParticles, DEMSimulation
+from materials import NeoHookean
+from particles import ParticleArrays
+from simulation import Simulation
+
+FORMAT_VERSION = 1
+HEADER_NAME = "header.json"
+
+
+def rng_state():
+    """ random と np.random の状態（JSONに書ける形） """
+    version, state, gauss_next = random.getstate()
+    np_state = np.random.get_state()
+    return {
+        "random": [version, list(state), gauss_next],
+        "numpy": [np_state[0], np_state[1].tolist()] + [v for v in np_state[2:]],
+    }
+
+
+def set_rng_state(state):
+    version, values, gauss_next = state["random"]
+    random.setstate((version, tuple(values), gauss_next))
+    name, keys, *rest = state["numpy"]
+    np.random.set_state((name, np.array(keys, dtype=np.uint32), *rest))
+
+
+def mpm_state(sim):
+    """ Simulation の設定と配列 """
+    material = None
+    if sim.material is not None:
+        material = {"youngs_modulus": sim.material.youngs_modulus, "poisson_ratio": sim.material.poisson_ratio}
+    config = {
+        "n_grid_side": sim.n_grid, "dt": sim.fixed_dt, "gravity": sim.gravity, "material": material,
+        "boundary_nodes": sim.boundary_nodes, "kernel": sim.weights.kernel, "cfl": sim.cfl,
+        "dt_max": sim.dt_max, "sort_interval": sim.sort_interval, "backend": sim.requested_backend,
+        "dtype": sim.dtype.name, "implicit": sim.implicit,
+        "sparse_block_size": None if sim.sparse is None else sim.sparse.block_size,
+    }
+    arrays = {name: getattr(sim.particles, name) for name in ParticleArrays.FIELDS}
+    arrays["grid_mass"], arrays["grid_vel"] = sim.dense_grid()
+    return config, arrays
+
+
+def dem_state(sim):
+    """ DEMSimulation の設定と配列（接触ペアのリストは復元後に作り直す） """
+    config = {
+        "dt": sim.fixed_dt, "gravity": sim.gravity, "restitution": sim.restitution, "k_spring": sim.k_spring,
+        "collision_method": sim.collision_method, "cfl": sim.cfl, "dt_max": sim.dt_max, "skin": sim.skin,
+    }
+    arrays = {name: getattr(sim.particles, name) for name in DEMParticles.FIELDS}
+    return config, arrays
+
+
+def save(sim, path):
+    """ sim の状態を path（ディレクトリ）に保存する
+
+    一時ディレクトリに書いてから置き換えるので、途中で止まっても前の保存は壊れない。
+    path にすでにあってよいのは前のチェックポイントか空のディレクトリだけで、ほかは ValueError にする。
+    """
+    if isinstance(sim, DEMSimulation):
+        kind, (config, arrays) = "dem", dem_state(sim)
+    else:
+        kind, (config, arrays) = "mpm", mpm_state(sim)
+    header = {
+        "format_version": FORMAT_VERSION, "kind": kind, "config": config,
+        # config の dt は設定した値、last_dt は適応時間刻みで最後に使った dt
+        "step_count": sim.step_count, "time": sim.time, "last_dt": sim.dt, "rng": rng_state(),
+        "arrays": {name: [list(a.shape), a.dtype.str] for name, a in arrays.items()},
+    }
+    path = os.path.abspath(os.fspath(path))
+    if os.path.exists(path) and not is_checkpoint(path) and (not os.path.isdir(path) or os.listdir(path)):
+        raise ValueError(f"{path} exists and is not a checkpoint")
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    tmp = tempfile.mkdtemp(dir=parent, prefix=os.path.basename(path) + ".")
+    try:
+        for name, a in arrays.items():
+            np.save(os.path.join(tmp, name + ".npy"), a)
+        with open(os.path.join(tmp, HEADER_NAME), "w") as f:
+            json.dump(header, f)
+        if os.path.exists(path):
+            # 前のチェックポイントを空の一時ディレクトリと入れ替えてから置き換え、最後に消す
+            old = tempfile.mkdtemp(dir=parent, prefix=os.path.basename(path) + ".")
+            os.replace(path, old)
+            os.replace(tmp, path)
+            shutil.rmtree(old)
+        else:
+            os.replace(tmp, path)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def is_checkpoint(path):
+    """ path が（前に保存した）チェックポイントのディレクトリかどうか """
+    return os.path.isfile(os.path.join(path, HEADER_NAME))
+
+
+def read_header(path):
+    with open(os.path.join(path, HEADER_NAME)) as f:
+        header = json.load(f)
+    if header.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"unsupported checkpoint format: {header.get('format_version')}")
+    return header
+
+
+def load(path, mmap=True, restore_rng=True, **options):
+    """ path に保存した状態からシミュレーションを作り直して返す
+
+    mmap が True なら配列をメモリマップで遅延読み込みする。
+    options でコンストラクタの引数（workers, backend など）を上書きできる。
+    """
+    path = os.fspath(path)
+    header = read_header(path)
+    mmap_mode = "c" if mmap else None
+    arrays = {name: np.asarray(np.load(os.path.join(path, name + ".npy"), mmap_mode=mmap_mode))
+              for name in header["arrays"]}
+    config = dict(header["config"])
+    config.update(options)
+
+    if header["kind"] == "dem":
+        particles = DEMParticles(arrays["pos"], arrays["vel"], arrays["mass"], arrays["radius"])
+        sim = DEMSimulation(particles, **config)
+    else:
+        particles = object.__new__(ParticleArrays)
+        for name in ParticleArrays.FIELDS:
+            setattr(particles, name, arrays[name])
+        if config.get("backend") == "jit" and not jit.AVAILABLE and "backend" not in options:
+            # numba のない環境でも、jit で保存したチェックポイントを読めるようにする
+            config["backend"] = "auto"
+        if config["material"] is not None:
+            config["material"] = NeoHookean(**config["material"])
+        sim = Simulation(particles, **config)
+        if sim.sparse is None:
+            sim.grid_mass[:] = arrays["grid_mass"]
+            sim.grid_vel[:] = arrays["grid_vel"]
+
+    sim.step_count = header["step_count"]
+    sim.time = header["time"]
+    sim.dt = header.get("last_dt", sim.dt)
+    if restore_rng:
+        set_rng_state(header["rng"])
+    return sim
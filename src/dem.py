@@ -0,0 +1,164 @@
+""" バネモデルによる粒子間衝突（DEM）シミュレーション
+
+粒子の状態は DEMParticles の配列にまとめ、力の計算・時間積分・壁での反射をまとめて配列で行う。
+接触の候補ペアは、接触距離（半径の合計）に skin を足した距離より近いペアのリスト（Verlet リスト）
+として持ち、前回作ったときからの移動量の大きい2粒子の移動量の和が skin 未満のうちはサブステップをまたいで
+使い回す（どの2粒子も skin 以上は近づいていないので、新しく接触するペアはリストに入っている）。
+"""
+import math
+
+import numpy as np
+
+import neighbors
+import timestep
+
+# Verlet リストの skin（粒子の最大半径に対する比）
+SKIN_RATIO = 1.0
+COLLISION_METHODS = ("verlet", "spatial_hash", "brute_force")
+
+
+class DEMParticles:
+    """ DEMの粒子の状態を連続したNumPy配列（SoA）として保持するコンテナ """
+
+    # 粒子ごとの配列の名前
+    FIELDS = ("pos", "vel", "mass", "radius")
+
+    def __init__(self, pos, vel=None, mass=1.0, radius=0.01):
+        pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+        n = pos.shape[0]
+        self.pos = pos.copy()   # 位置 (N, 2)
+        self.vel = np.zeros((n, 2)) if vel is None else np.array(vel, dtype=float).reshape(n, 2)    # 速度 (N, 2)
+        self.mass = np.broadcast_to(np.asarray(mass, dtype=float), (n,)).copy()  # 質量 (N,)
+        self.radius = np.broadcast_to(np.asarray(radius, dtype=float), (n,)).copy()  # 半径 (N,)
+
+    def __len__(self):
+        return self.pos.shape[0]
+
+
+class DEMSimulation:
+    """ バネモデルによる粒子間衝突（DEM）シミュレーションの本体（tkinterに依存しない） """
+
+    # 計測するフェーズ名 -> メソッド名（instrument.PhaseTimers.attach で使う）
+    PHASES = {"step": "substep", "neighbors": "update_contacts", "collisions": "handle_particle_collisions",
+              "integrate": "integrate"}
+
+    def __init__(self, particles, dt=1e-4, gravity=(0.0, -9.8), restitution=0.8, k_spring=5000.0,
+                 collision_method="verlet", cfl=None, dt_max=None, skin=None):
+        self.particles = particles
+        # fixed_dt は設定した dt、self.dt は直前のステップで使った dt
+        self.fixed_dt = dt
+        self.dt = dt
+        # cfl を渡すと各ステップの dt を最大速度・半径・バネの固有周期から決める（None なら dt 固定）
+        self.cfl = cfl
+        self.dt_max = dt_max
+        self.gravity = list(gravity)
+        self.restitution = restitution
+        self.k_spring = k_spring
+        # 衝突の近傍探索: "verlet"（skin 付きのペアのリストを使い回す）、"spatial_hash"（毎ステップ
+        # セルリストで探す）、"brute_force"（毎ステップ全ペアを調べる）
+        if collision_method not in COLLISION_METHODS:
+            raise ValueError(f"unknown collision method: {collision_method}"
+                             f" (choose from {', '.join(COLLISION_METHODS)})")
+        self.collision_method = collision_method
+        # skin を省略すると最大半径の SKIN_RATIO 倍
+        max_radius = float(particles.radius.max()) if len(particles) else 0.0
+        self.skin = SKIN_RATIO * max_radius if skin is None else skin
+        if collision_method != "verlet":
+            self.skin = 0.0
+        # 接触の候補ペア (i, j, 接触距離) と、それを作ったときの位置
+        self.pairs = None
+        self.pairs_pos = None
+        self.rebuild_count = 0
+        self.force = np.zeros((len(particles), 2))
+        self.step_count = 0
+        self.time = 0.0
+        # 保存量のモニタ（diagnostics.Diagnostics.attach で設定する）
+        self.diagnostics = None
+
+    def step(self, n=1):
+        """ n ステップ分シミュレーションを進める """
+        for _ in range(n):
+            self.substep(self.stable_dt())
+
+    def advance(self, duration):
+        """ シミュレーション時間を duration だけ進め、使ったサブステップ数を返す """
+        return timestep.advance(self, duration)
+
+    def stable_dt(self):
+        """ 次のステップで使う dt（固定 dt か、CFL条件から決めた最大の dt） """
+        p = self.particles
+        if self.cfl is None or not len(p):
+            return self.fixed_dt
+        max_speed = math.sqrt(float(np.einsum("ij,ij->i", p.vel, p.vel).max()))
+        radius = float(p.radius.min())
+        # 1ステップで半径の cfl 倍以上動かない
+        dt = timestep.cfl_dt(max_speed, radius, self.cfl, math.hypot(*self.gravity))
+        # バネの振動（2粒子の相対運動の固有角振動数 ω = sqrt(2k / m)）を1周期あたり十分なステップで解像する
+        omega = math.sqrt(2.0 * self.k_spring / float(p.mass.min()))
+        dt = min(dt, self.cfl / omega)
+        if self.dt_max is not None:
+            dt = min(dt, self.dt_max)
+        return dt
+
+    def substep(self, dt):
+        """ 時間幅 dt で1ステップ進める """
+        self.dt = dt
+        self.update_contacts()
+        # 重力と粒子間の衝突力を合計し、それに基づいて全粒子の物理状態を更新
+        self.handle_particle_collisions()
+        self.integrate(dt)
+        self.step_count += 1
+        self.time += dt
+        if self.diagnostics is not None:
+            self.diagnostics.after_step(self)
+
+    def update_contacts(self):
+        """ 接触の候補ペアのリストを必要なら作り直す """
+        p = self.particles
+        if self.pairs is not None and self.collision_method == "brute_force":
+            # 全ペアは粒子が動いても変わらない
+            return
+        if self.pairs is not None and self.skin > 0.0:
+            # 2粒子が作ったときより近づいた量は、それぞれの移動量の和以下。
+            # 移動量の大きい2つの和が skin 未満なら、新しく接触したペアはすべてリストに入っている
+            d = p.pos - self.pairs_pos
+            moved = np.sqrt(np.einsum("ij,ij->i", d, d))
+            if len(moved) < 2 or np.partition(moved, -2)[-2:].sum() < self.skin:
+                return
+        if self.collision_method == "brute_force":
+            i, j = np.triu_indices(len(p), 1)
+            self.pairs = (i, j, p.radius[i] + p.radius[j])
+        else:
+            self.pairs = neighbors.contact_pairs(p.pos, p.radius, self.skin)
+        self.pairs_pos = p.pos.copy()
+        self.rebuild_count += 1
+
+    def handle_particle_collisions(self):
+        """ 重力と、候補ペアのうち重なっているものの反発力を self.force に合計する """
+        p = self.particles
+        i, j, contact = self.pairs
+        np.multiply(p.mass[:, np.newaxis], self.gravity, out=self.force)
+        neighbors.spring_forces(p.pos, contact, i, j, self.k_spring, out=self.force)
+
+    def integrate(self, dt):
+        """ 力の合計に基づいて速度・位置を更新し（半陰的オイラー法）、壁で反射させる """
+        p = self.particles
+        p.vel += self.force / p.mass[:, np.newaxis] * dt
+        p.pos += p.vel * dt
+        # 壁との衝突判定と処理（左右の壁・床と天井）
+        r = p.radius[:, np.newaxis]
+        low = p.pos - r < 0.0
+        high = p.pos + r > 1.0
+        np.copyto(p.pos, r, where=low)
+        np.copyto(p.pos, 1.0 - r, where=high)
+        p.vel[low | high] *= -self.restitution
+
+    # 状態の参照用
+    def positions(self):
+        return self.particles.pos
+
+    def velocities(self):
+        return self.particles.vel
+
+    def num_particles(self):
+        return len(self.particles)
@@ -0,0 +1,206 @@
+""" GUIなしでシミュレーションを N ステップ全速力で回し、steps/sec を表示する
+
+使い方:
+    python src/headless.py only_gravity --steps 1000 --particles 100000
+    python src/headless.py elasticity --sim-time 2.0   # シミュレーション時間で指定（適応時間刻み）
+    python src/headless.py only_gravity --particles 1000000 --workers 8   # 8プロセスで並列に計算
+    python src/headless.py only_gravity --particles 1000000 --backend numpy   # Numbaを使わずに計算
+    python src/headless.py elasticity --sim-time 2.0 --implicit   # 陰解法で大きな dt で進める
+    python src/headless.py elasticity --steps 5000 --save run.ckpt   # 最後の状態を保存
+    python src/headless.py --restore run.ckpt --steps 5000   # 保存した状態から続きを計算
+    python src/headless.py only_gravity --steps 1000 --output frames   # 10ステップごとのフレームを保存
+    python src/headless.py elasticity --steps 1000 --timers   # フェーズごとの時間（平均・p95）を表示
+    python src/headless.py elasticity --steps 200 --profile   # cProfile の結果を表示
+    python src/headless.py elasticity --steps 2000 --diagnostics 100   # 100ステップごとに保存量を記録
+    python src/headless.py scenes/elasticity.json --sim-time 1.0   # JSONのシーンファイルから作る
+"""
+import argparse
+import importlib
+import os
+import time
+
+import checkpoint
+import diagnostics
+import instrument
+import scenefile
+from output import FrameWriter
+
+DIAGNOSTICS_NAME = "diagnostics.jsonl"   # --output のディレクトリに書く保存量の記録の名前
+
+# シーン名 -> シーンを定義しているスクリプト（create_simulation を持つモジュール）
+SCENES = {
+    "only_gravity": "only_gravity",
+    "elasticity": "elasticity_neo_hookean",
+    "dem": "main",
+}
+
+
+def load_scene(name):
+    return importlib.import_module(SCENES.get(name, name))
+
+
+def scene_engine(scene=None, restore=None):
+    """ シーン（またはチェックポイント）のシミュレーションの種類（"mpm" か "dem"） """
+    if restore is not None:
+        return checkpoint.read_header(restore)["kind"]
+    if scene.endswith(".json"):
+        return scenefile.load(scene).get("engine", "mpm")
+    return getattr(load_scene(scene), "ENGINE", "mpm")
+
+
+def create_simulation(scene, n_particles=None, **options):
+    if scene.endswith(".json"):
+        # シーンファイルでは粒子数は物体ごとの count で決める
+        if n_particles is not None:
+            raise ValueError("the particle count of a scene file is set by each body's count")
+        return scenefile.build(scenefile.load(scene), **options)
+    module = load_scene(scene)
+    if n_particles is not None:
+        return module.create_simulation(n_particles, **options)
+    return module.create_simulation(**options)
+
+
+def run(sim, steps, writer=None, output_every=10):
+    """ sim を steps ステップ進め、経過時間（秒）を返す
+
+    writer を渡すと output_every ステップごとにフレームを書き出す。
+    """
+    start = time.perf_counter()
+    if writer is None:
+        sim.step(steps)
+    else:
+        done = 0
+        while done < steps:
+            n = min(output_every, steps - done)
+            sim.step(n)
+            done += n
+            writer.write(sim)
+    return time.perf_counter() - start
+
+
+def run_for(sim, duration, writer=None, frame_time=1.0 / 60.0):
+    """ sim をシミュレーション時間 duration だけ進め、(経過時間, ステップ数) を返す
+
+    writer を渡すとシミュレーション時間 frame_time ごとにフレームを書き出す。
+    """
+    start = time.perf_counter()
+    if writer is None:
+        steps = sim.advance(duration)
+    else:
+        steps = 0
+        end = sim.time + duration
+        while end - sim.time > 1e-12 * max(1.0, abs(end)):
+            steps += sim.advance(min(frame_time, end - sim.time))
+            writer.write(sim)
+    return time.perf_counter() - start, steps
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ヘッドレスでシミュレーションを実行する")
+    parser.add_argument("scene", nargs="?", default=None,
+                        help="シーン名 (" + ", ".join(SCENES) + ")、モジュール名またはシーンファイル (.json)")
+    parser.add_argument("--steps", type=int, default=1000, help="実行するステップ数")
+    parser.add_argument("--sim-time", type=float, default=None,
+                        help="ステップ数の代わりにシミュレーション時間で指定する")
+    parser.add_argument("--particles", type=int, default=None, help="粒子数（省略時はシーンの既定値）")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="MPMのP2G/G2Pを並列に計算するプロセス数（グリッドは密になる）")
+    parser.add_argument("--backend", choices=("auto", "numpy", "jit"), default=None,
+                        help="MPMの計算方法（省略時はシーンの既定値、jit ではグリッドは密になる）")
+    parser.add_argument("--dtype", choices=("float64", "float32"), default=None,
+                        help="MPMの粒子とグリッドの浮動小数点の型（省略時はシーンの既定値）")
+    parser.add_argument("--implicit", action="store_true",
+                        help="MPMのグリッドの速度を陰解法で解く（弾性波のCFL条件より大きな dt で進める）")
+    parser.add_argument("--restore", default=None, help="シーンの代わりにこのチェックポイントから始める")
+    parser.add_argument("--save", default=None, help="最後の状態をこのチェックポイントに保存する")
+    parser.add_argument("--output", default=None, help="フレームをこのディレクトリに書き出す")
+    parser.add_argument("--output-every", type=int, default=10, help="何ステップごとにフレームを書き出すか")
+    parser.add_argument("--frame-time", type=float, default=1.0 / 60.0,
+                        help="--sim-time のとき、このシミュレーション時間ごとにフレームを書き出す")
+    parser.add_argument("--output-dtype", choices=("float16", "float32", "float64"), default="float16",
+                        help="書き出す配列の型")
+    parser.add_argument("--output-grid", action="store_true", help="MPMのグリッドも書き出す")
+    parser.add_argument("--timers", action="store_true", help="フェーズごとの時間（平均・p95）を表示する")
+    parser.add_argument("--profile", action="store_true", help="cProfile の結果を表示する")
+    parser.add_argument("--profile-output", default=None, help="cProfile の結果をこのファイルに保存する")
+    parser.add_argument("--sample", action="store_true", help="サンプリングで時間を使っている関数を表示する")
+    parser.add_argument("--diagnostics", type=int, default=None, metavar="K",
+                        help="K ステップごとに質量・運動量・エネルギーを記録し、最後に変化を表示する")
+    parser.add_argument("--diagnostics-output", default=None,
+                        help="保存量の記録を書き出すJSON Linesファイル（省略時は --output のディレクトリの中）")
+    args = parser.parse_args(argv)
+    if (args.scene is None) == (args.restore is None):
+        parser.error("give either a scene or --restore")
+
+    # MPMだけの引数は、指定されたものだけをMPMのシーンに渡す
+    mpm_flags = [flag for flag, given in (("--workers", args.workers), ("--backend", args.backend),
+                                          ("--dtype", args.dtype), ("--implicit", args.implicit)) if given]
+    if mpm_flags and scene_engine(args.scene, args.restore) != "mpm":
+        parser.error(f"{', '.join(mpm_flags)} can only be used with MPM scenes")
+    options = {}
+    if args.workers:
+        options = dict(workers=args.workers, sparse_block_size=None, backend="numpy")
+    if args.backend is not None:
+        options["backend"] = args.backend
+        if args.backend == "jit":
+            # jit は密なグリッドで計算する
+            options["sparse_block_size"] = None
+    if args.dtype is not None:
+        options["dtype"] = args.dtype
+    if args.implicit:
+        options["implicit"] = True
+    if args.restore is not None:
+        sim = checkpoint.load(args.restore, **options)
+    else:
+        sim = create_simulation(args.scene, args.particles, **options)
+    writer = None
+    if args.output is not None:
+        writer = FrameWriter(args.output, dtype=args.output_dtype, grid=args.output_grid)
+    timers = None
+    if args.timers:
+        timers = instrument.PhaseTimers(window=1000)
+        timers.attach(sim, sim.PHASES)
+    monitor = None
+    if args.diagnostics:
+        path = args.diagnostics_output
+        if path is None and args.output is not None:
+            path = os.path.join(args.output, DIAGNOSTICS_NAME)
+        monitor = diagnostics.Diagnostics(args.diagnostics, path).attach(sim)
+
+    def execute():
+        if args.sim_time is None:
+            return run(sim, args.steps, writer, args.output_every), args.steps
+        return run_for(sim, args.sim_time, writer, args.frame_time)
+
+    samples = None
+    if args.profile or args.profile_output:
+        elapsed, steps = instrument.profile(execute, args.profile_output)
+    elif args.sample:
+        (elapsed, steps), samples = instrument.sample(execute)
+    else:
+        elapsed, steps = execute()
+    if writer is not None:
+        writer.close()
+    steps_per_sec = steps / elapsed if elapsed > 0 else float("inf")
+    print(f"scene: {args.scene or args.restore}  particles: {sim.num_particles()}  steps: {steps}"
+          f"  sim-time: {sim.time:.4f}")
+    print(f"elapsed: {elapsed:.3f} s  steps/s: {steps_per_sec:.1f}"
+          f"  particle-steps/s: {steps_per_sec * sim.num_particles():.3e}")
+    if timers is not None:
+        timers.detach()
+        print(timers.summary())
+    if monitor is not None:
+        monitor.close()
+        print(monitor.summary())
+    if samples is not None:
+        total = sum(count for _, count in samples) or 1
+        for name, count in samples:
+            print(f"{100.0 * count / total:5.1f}%  {name}")
+    if args.save is not None:
+        checkpoint.save(sim, args.save)
+    if hasattr(sim, "close"):
+        sim.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+""" 直近のフレームをメモリに残すリングバッファ（ビューアの巻き戻し・再生用）
+
+メモリは最初に max_bytes 以内でまとめて確保し、古いフレームから上書きする。
+keyframe_interval フレームごとの先頭のフレーム（キーフレーム）だけを float32 で持ち、
+残りはキーフレームとの差を dtype（既定 float16）で持つ（差は小さいので float16 でも精度が落ちにくい）。
+差は直前のフレームではなくキーフレームからとるので、誤差はたまらず、どのフレームもすぐに取り出せる。
+keyframe_interval が 1 なら全フレームを dtype でそのまま持つ。
+粒子を並べ替えるシミュレーション（particles.ids を持つもの）では最初の番号順に並べ直して残す。
+"""
+import numpy as np
+
+DEFAULT_FRAMES = 600    # 残すフレーム数の上限（60 fps で10秒）
+DEFAULT_BYTES = 256 * 2**20    # 使うメモリの上限
+KEYFRAME_INTERVAL = 16
+
+
+class FrameHistory:
+    """ 直近のフレームの粒子の配列（既定では位置のみ）を残すリングバッファ
+
+    write(sim) で1フレーム残し（output.FrameWriter と同じ呼び方）、frame(k) で
+    古い順に k 番目（負なら新しい方から）のフレームを ({step, time}, {名前: 配列}) で返す。
+    キーフレームを上書きするとそのブロックの残りも読めなくなるので、残っているフレーム数は
+    capacity - keyframe_interval + 1 から capacity の間になる。
+    """
+
+    def __init__(self, n_particles, max_frames=DEFAULT_FRAMES, max_bytes=DEFAULT_BYTES, dtype="float16",
+                 keyframe_interval=KEYFRAME_INTERVAL, fields=("pos",)):
+        self.dtype = np.dtype(dtype)
+        self.interval = max(int(keyframe_interval), 1)
+        self.fields = tuple(fields)
+        shape = (n_particles, 2)
+        # 1フレームあたりのバイト数（キーフレームの分は interval フレームで割り振る）
+        frame_bytes = len(self.fields) * n_particles * 2 * self.dtype.itemsize + 16
+        if self.interval > 1:
+            frame_bytes += len(self.fields) * n_particles * 2 * 4 / self.interval
+        capacity = min(max_frames, int(max_bytes // frame_bytes))
+        self.capacity = capacity - capacity % self.interval
+        if self.capacity < max(self.interval, 2):
+            raise ValueError(f"max_bytes={max_bytes} is too small to keep {n_particles} particles")
+        self.data = {name: np.zeros((self.capacity,) + shape, dtype=self.dtype) for name in self.fields}
+        self.keyframes = {}
+        if self.interval > 1:
+            self.keyframes = {name: np.zeros((self.capacity // self.interval,) + shape, dtype=np.float32)
+                              for name in self.fields}
+        self.steps = np.zeros(self.capacity, dtype=np.int64)
+        self.times = np.zeros(self.capacity)
+        self.count = 0      # これまでに残したフレーム数（次のフレームの通し番号）
+        self.oldest = 0     # 読めるうちで一番古いフレームの通し番号
+
+    def __len__(self):
+        return self.count - self.oldest
+
+    @property
+    def nbytes(self):
+        arrays = list(self.data.values()) + list(self.keyframes.values()) + [self.steps, self.times]
+        return sum(a.nbytes for a in arrays)
+
+    def write(self, sim):
+        """ sim の今の状態を1フレームとして残す """
+        arrays = {"pos": sim.positions(), "vel": sim.velocities()}
+        ids = getattr(getattr(sim, "particles", None), "ids", None)
+        if ids is not None:
+            # 並べ替える前の番号順に戻す（キーフレームとの差が粒子ごとに意味を持つように）
+            for name in self.fields:
+                unsorted = np.empty_like(arrays[name])
+                unsorted[ids] = arrays[name]
+                arrays[name] = unsorted
+        self.record({name: arrays[name] for name in self.fields}, sim.step_count, sim.time)
+
+    def record(self, arrays, step, time):
+        g = self.count
+        slot = g % self.capacity
+        if slot % self.interval == 0 and g >= self.capacity:
+            # キーフレームを上書きすると、同じブロックの古いフレームは読めなくなる
+            self.oldest = g - self.capacity + self.interval
+        for name in self.fields:
+            a = arrays[name]
+            if self.interval == 1:
+                self.data[name][slot] = a
+                continue
+            key = self.keyframes[name][slot // self.interval]
+            if slot % self.interval == 0:
+                key[:] = a
+                self.data[name][slot] = 0.0
+            else:
+                np.subtract(a, key, out=self.data[name][slot], casting="unsafe")
+        self.steps[slot], self.times[slot] = step, time
+        self.count += 1
+
+    def frame(self, k):
+        """ 古い順に k 番目のフレーム ({step, time}, {名前: float32 の配列}) """
+        n = len(self)
+        if not -n <= k < n:
+            raise IndexError(f"frame {k} is not in the history ({n} frames)")
+        slot = (self.oldest + k % n) % self.capacity
+        arrays = {}
+        for name in self.fields:
+            a = self.data[name][slot].astype(np.float32)
+            if self.interval > 1:
+                a += self.keyframes[name][slot // self.interval]
+            arrays[name] = a
+        return {"step": int(self.steps[slot]), "time": float(self.times[slot])}, arrays
@@ -0,0 +1,152 @@
+""" 陰解法（後退オイラー）によるグリッドの速度の更新
+
+硬い材料では、陽解法の dt は弾性波のCFL条件で小さく抑えられる。ここでは
+    (M - dt² ∂f/∂x) v = M v*
+（v* は陽解法で求めたグリッドの速度）を力の変化について線形化した後退オイラーとして、
+質量のあるノードの速度について、行列を作らない共役勾配法（対角成分で前処理する）で解く。
+∂f/∂x をかける操作は、粒子ごとに δF = dt (Σ v ∇wᵀ) F、δP = ∂P/∂F : δF を計算し、
+V δP Fᵀ ∇w をグリッドへ散布して求める（重みと勾配はP2Gで計算したものを使い回す）。
+∂P/∂F は粒子ごとの 4x4 行列としてステップの最初に作り、負の固有値を0にしておく
+（大きく潰れたNeo-Hookeanでは正定値でなくなり、共役勾配法が破綻するため）。
+"""
+import numpy as np
+
+import transfer
+
+TOLERANCE = 1e-5    # 残差が右辺のこの割合まで小さくなったら止める
+MAX_ITERATIONS = 200
+BOUNDARY_PASSES = 4     # 壁で止める成分を決め直して解き直す回数の上限
+# 散布で1回のbincountにまとめるチャンネル（0: X, 1: Y）
+AXES = np.arange(2)
+
+
+class ImplicitSolver:
+    """ 1ステップごとにグリッドの速度を陰的に解き直す
+
+    iterations, residual に直前のステップの反復回数（解き直した分も含む）と相対残差を残す。
+    """
+
+    def __init__(self, material, tolerance=TOLERANCE, max_iterations=MAX_ITERATIONS):
+        self.material = material
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.iterations = 0
+        self.residual = 0.0
+
+    def prepare(self, cache, particles, dt):
+        """ 反復の間は変わらない粒子ごとの値を計算しておく """
+        F = particles.F
+        n = F.shape[0]
+        self.F_T = F.transpose(0, 2, 1)
+        F_inv_T = np.linalg.inv(F).transpose(0, 2, 1)
+        log_J = np.log(np.linalg.det(F))
+        # ∂P/∂F の各列を、F の各成分だけを1にした δF に対する dP として作る
+        hessian = np.empty((n, 4, 4), dtype=F.dtype)
+        for k, unit in enumerate(np.eye(4, dtype=F.dtype).reshape(4, 2, 2)):
+            dF = np.broadcast_to(unit, F.shape)
+            hessian[:, :, k] = self.material.first_piola_differential(dF, F_inv_T, log_J).reshape(n, 4)
+        eigenvalues, eigenvectors = np.linalg.eigh(hessian)
+        np.maximum(eigenvalues, 0.0, out=eigenvalues)
+        self.hessian = (eigenvectors * eigenvalues[:, np.newaxis, :]) @ eigenvectors.transpose(0, 2, 1)
+        # dt² V（δF の dt と力を速度に直す dt）
+        self.scale = (dt * dt * particles.volume)[:, np.newaxis, np.newaxis]
+        n, k = cache.node.shape
+        index = cache.buffer("implicit_index", (n, k, 2), np.int64)
+        np.multiply(cache.node[:, :, np.newaxis], 2, out=index)
+        index += AXES
+        self.index = index.ravel()
+
+    def diagonal(self, cache, particles, size):
+        """ dt² (-∂f/∂x) の対角成分 (M, 2)（前処理に使う） """
+        # ノード i の成分 a だけを動かすと δF = e_a gᵀ（g = Fᵀ ∇w）になる
+        g = np.einsum("nji,nkj->nki", particles.F, cache.grad)
+        hessian = self.hessian.reshape(-1, 2, 2, 2, 2)
+        term = cache.buffer("implicit_term", cache.grad.shape, cache.grad.dtype)
+        for a in range(2):
+            np.einsum("nbc,nkb,nkc->nk", hessian[:, a, :, a, :], g, g, out=term[..., a])
+        term *= self.scale[:, :, 0, np.newaxis]
+        return np.bincount(self.index, weights=term.ravel(), minlength=size).reshape(-1, 2)
+
+    def stiffness(self, cache, particles, v):
+        """ dt² (-∂f/∂x) v をノードごとに (M, 2) で返す """
+        # 速度の勾配 Σ v ∇wᵀ と、それで dt 動いたときの変形勾配の変化（dt は scale にまとめる）
+        # 反復の v は float64 なので、G2P の（float32 のこともある）作業用の配列とは分ける
+        grad_v = transfer.gather(cache, v, "implicit_node_vel").transpose(0, 2, 1) @ cache.grad
+        dF = grad_v @ particles.F
+        dP = (self.hessian @ dF.reshape(-1, 4, 1)).reshape(dF.shape)
+        stress = dP @ self.F_T
+        stress *= self.scale
+        term = cache.buffer("implicit_term", cache.grad.shape, cache.grad.dtype)
+        np.matmul(cache.grad, stress.transpose(0, 2, 1), out=term)
+        return np.bincount(self.index, weights=term.ravel(), minlength=v.size).reshape(v.shape)
+
+    def solve(self, cache, particles, dt, grid_mass, grid_vel, boundary=None):
+        """ grid_vel（陽解法の速度 v*）を後退オイラーの速度で置き換える
+
+        boundary は grid_vel に壁の条件をかける関数。解いた速度で壁の外向きに進もうとした
+        成分を止めて固定し、新しく止める成分がなくなるまで解き直す（固定する成分は増える一方）。
+        """
+        self.prepare(cache, particles, dt)
+        # 前処理に使う対角成分（固定する成分が変わっても同じ）
+        self.preconditioner = grid_mass.reshape(-1, 1) + self.diagonal(cache, particles, grid_vel.size)
+        self.iterations = 0
+        self.residual = 0.0
+        # 右辺 M v* は解き直しても変わらない
+        momentum = grid_mass.reshape(-1, 1) * grid_vel.reshape(-1, 2)
+        fixed = None
+        for _ in range(BOUNDARY_PASSES):
+            self.solve_linear(cache, particles, grid_mass, grid_vel, momentum, fixed)
+            if boundary is None:
+                return
+            before = grid_vel.copy()
+            boundary()
+            clamped = grid_vel != before
+            if not clamped.any():
+                return
+            fixed = clamped if fixed is None else fixed | clamped
+
+    def solve_linear(self, cache, particles, grid_mass, grid_vel, momentum, fixed=None):
+        """ (M - dt² ∂f/∂x) v = momentum (M v*) を grid_vel から始めて解く
+
+        fixed が True の成分は grid_vel の今の値のまま動かさない。
+        """
+        mass = grid_mass.reshape(-1)
+        vel = grid_vel.reshape(-1, 2)
+        # 質量のあるノードの、固定していない成分だけが未知数
+        free = np.repeat((mass > 1e-10)[:, np.newaxis], 2, axis=1)
+        if fixed is not None:
+            free &= ~fixed.reshape(-1, 2)
+        inv_diagonal = np.divide(1.0, self.preconditioner, out=np.zeros_like(self.preconditioner), where=free)
+
+        def apply(v):
+            result = mass[:, np.newaxis] * v + self.stiffness(cache, particles, v)
+            result *= free
+            return result
+
+        rhs = momentum * free
+        rhs_norm = np.linalg.norm(rhs)
+        # 反復は float64 で行う（float32 のグリッドでも精度を落とさず、作業用の配列の型も変わらない）
+        x = vel.astype(np.float64)
+        r = rhs - apply(x)
+        z = r * inv_diagonal
+        direction = z.copy()
+        rz = np.vdot(r, z)
+        if rhs_norm == 0.0:
+            return
+        for _ in range(self.max_iterations):
+            self.residual = np.linalg.norm(r) / rhs_norm
+            if self.residual <= self.tolerance:
+                break
+            Ad = apply(direction)
+            curvature = np.vdot(direction, Ad)
+            if curvature <= 0.0:
+                break
+            alpha = rz / curvature
+            x += alpha * direction
+            r -= alpha * Ad
+            z = r * inv_diagonal
+            rz, rz_old = np.vdot(r, z), rz
+            direction *= rz / rz_old
+            direction += z
+            self.iterations += 1
+        vel[:] = x
@@ -0,0 +1,129 @@
+""" フェーズごとの処理時間の計測とプロファイラの呼び出し
+
+PhaseTimers.attach(obj, phases) は obj のメソッドを時間を測るものにインスタンス単位で差し替え、
+detach() で元に戻す。計測していないときは何も差し替えていないので、余分なコストはかからない。
+各フェーズの直近 window 回の時間から平均と95パーセンタイルを出す。
+"""
+import cProfile
+import io
+import pstats
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+
+class PhaseTimers:
+    """ フェーズ名ごとの処理時間（直近 window 回分と累計）を持つタイマー """
+
+    def __init__(self, window=200):
+        self.window = window
+        self.samples = {}
+        self.totals = {}
+        self.counts = {}
+        self.attached = []  # 差し替えた (オブジェクト, メソッド名)
+
+    @property
+    def enabled(self):
+        return bool(self.attached)
+
+    def record(self, name, seconds):
+        if name not in self.samples:
+            self.samples[name] = deque(maxlen=self.window)
+            self.totals[name] = 0.0
+            self.counts[name] = 0
+        self.samples[name].append(seconds)
+        self.totals[name] += seconds
+        self.counts[name] += 1
+
+    def wrap(self, name, func):
+        """ 呼ばれるたびに経過時間を name に記録する func """
+        record, perf_counter = self.record, time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, perf_counter() - start)
+
+        return timed
+
+    def attach(self, obj, phases):
+        """ phases（フェーズ名 -> メソッド名）のメソッドを計測付きに差し替える """
+        for name, method in phases.items():
+            if (obj, method) in self.attached:
+                continue
+            setattr(obj, method, self.wrap(name, getattr(obj, method)))
+            self.attached.append((obj, method))
+
+    def detach(self):
+        """ 差し替えたメソッドを元に戻す（インスタンスの属性を消すとクラスのメソッドが見える） """
+        for obj, method in self.attached:
+            delattr(obj, method)
+        self.attached = []
+
+    def reset(self):
+        self.samples, self.totals, self.counts = {}, {}, {}
+
+    def stats(self):
+        """ {フェーズ名: {"mean", "p95", "count", "total"}}（mean, p95 は直近 window 回、秒） """
+        result = {}
+        # 別スレッド（physics_thread）が記録している最中でも読めるよう、先にコピーしてから計算する
+        for name, samples in list(self.samples.items()):
+            values = np.array(tuple(samples), dtype=float)
+            result[name] = {
+                "mean": float(values.mean()), "p95": float(np.percentile(values, 95)),
+                "count": self.counts[name], "total": self.totals[name],
+            }
+        return result
+
+    def summary(self):
+        """ 画面やログに出す1フェーズ1行の文字列（ミリ秒） """
+        return "\n".join(f"{name:<12} {s['mean'] * 1e3:7.2f} ms  p95 {s['p95'] * 1e3:7.2f} ms"
+                         for name, s in self.stats().items())
+
+
+def profile(func, path=None, sort="cumulative", limit=25):
+    """ func() を cProfile の下で実行し、結果を path に保存するか上位 limit 件を表示する """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return func()
+    finally:
+        profiler.disable()
+        if path is not None:
+            profiler.dump_stats(path)
+        else:
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+            print(out.getvalue())
+
+
+def sample(func, interval=1e-3, limit=25):
+    """ func() を実行しながら別スレッドで呼び出し中の関数を interval ごとに数える（サンプリング）
+
+    cProfile より軽く、NumPy の中で時間を使っている関数も見つけられる。
+    戻り値は (func の戻り値, [(関数, 回数), ...])。
+    """
+    target = threading.get_ident()
+    counts = Counter()
+    done = threading.Event()
+
+    def sampler():
+        while not done.wait(interval):
+            frame = sys._current_frames().get(target)
+            if frame is not None:
+                code = frame.f_code
+                counts[f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"] += 1
+
+    thread = threading.Thread(target=sampler, daemon=True)
+    thread.start()
+    try:
+        result = func()
+    finally:
+        done.set()
+        thread.join()
+    return result, counts.most_common(limit)
@@ -0,0 +1,294 @@
+""" Numbaでコンパイルした、1ステップ分のP2G・グリッド更新・G2Pをまとめたカーネル
+
+NumPy版（transfer.py）は (N, K, 2) などの一時配列を何本も作るが、こちらは
+粒子ごとに重み・応力を計算してそのままグリッドへ足し込むので一時配列がいらない。
+P2Gは粒子をグリッドのタイルごとに数え分け、隣り合わないタイルを並列に処理して
+1枚のグリッドへ直接散布する（スレッドごとのグリッドはいらない）。
+G2Pでは重みを計算し直し、粒子ごとに並列に更新する。
+numba がなければ AVAILABLE が False になり、Simulation はNumPy版を使う。
+"""
+import math
+
+import numpy as np
+
+import transfer
+
+try:
+    import numba
+    from numba import prange
+except ImportError:
+    numba = None
+    prange = range
+
+AVAILABLE = numba is not None
+
+# カーネル名 -> 番号（コンパイルしたカーネルの中で分岐に使う）
+KERNEL_IDS = {"linear": 0, "quadratic": 1, "cubic": 2}
+# P2Gで粒子をまとめるタイルの一辺のノード数（カーネルの幅より大きくする）
+TILE_SIZE = 16
+
+
+def njit(*args, **kwargs):
+    """ numba があれば numba.njit、なければ何もしないデコレータ """
+    if numba is None:
+        return lambda func: func
+    return numba.njit(*args, cache=True, **kwargs)
+
+
+@njit(inline="always")
+def kernel_weight(kernel_id, t):
+    """ 1次元の補間カーネル N(t) と微分 N'(t)（transfer の各カーネルと同じ式） """
+    a = abs(t)
+    s = 1.0 if t > 0.0 else (-1.0 if t < 0.0 else 0.0)
+    if kernel_id == 0:
+        if a < 1.0:
+            return 1.0 - a, -s
+    elif kernel_id == 1:
+        if a < 0.5:
+            return 0.75 - a * a, -2.0 * t
+        if a < 1.5:
+            return 0.5 * (1.5 - a)**2, -(1.5 - a) * s
+    else:
+        if a < 1.0:
+            return 0.5 * a**3 - a * a + 2.0 / 3.0, 1.5 * t * a - 2.0 * t
+        if a < 2.0:
+            return (2.0 - a)**3 / 6.0, -0.5 * (2.0 - a)**2 * s
+    return 0.0, 0.0
+
+
+@njit(parallel=True)
+def bin_particles(pos, shift, dx, tile_size, n_tiles, tile_of, tile_start, order):
+    """ 粒子を左下のノード（base）のあるタイルごとに数え分け、タイル順の粒子番号を order に入れる
+
+    タイル t の粒子は order[tile_start[t]:tile_start[t + 1]] になる。
+    """
+    n = pos.shape[0]
+    for p in prange(n):
+        tx = int(math.floor(pos[p, 0] / dx - shift)) // tile_size
+        ty = int(math.floor(pos[p, 1] / dx - shift)) // tile_size
+        tile_of[p] = min(max(ty, 0), n_tiles - 1) * n_tiles + min(max(tx, 0), n_tiles - 1)
+    tile_start[:] = 0
+    for p in range(n):
+        tile_start[tile_of[p] + 1] += 1
+    for t in range(n_tiles * n_tiles):
+        tile_start[t + 1] += tile_start[t]
+    fill = tile_start[:-1].copy()
+    for p in range(n):
+        t = tile_of[p]
+        order[fill[t]] = p
+        fill[t] += 1
+
+
+@njit(parallel=True)
+def clear_tiles(tiles, tile_size, grid_mass, grid_vel):
+    """ tiles に並べたタイルのノードを0にする """
+    n_grid = grid_mass.shape[0]
+    n_tiles = (n_grid + tile_size - 1) // tile_size
+    for k in prange(tiles.shape[0]):
+        ty, tx = tiles[k] // n_tiles, tiles[k] % n_tiles
+        for y in range(ty * tile_size, min((ty + 1) * tile_size, n_grid)):
+            for x in range(tx * tile_size, min((tx + 1) * tile_size, n_grid)):
+                grid_mass[y, x] = 0.0
+                grid_vel[y, x, 0] = 0.0
+                grid_vel[y, x, 1] = 0.0
+
+
+@njit(parallel=True)
+def p2g_kernel(pos, vel, mass, volume, F, C, kernel_id, support, shift, d_inv_coef,
+               elastic, mu, lam, dx, dt, tile_size, tile_start, order, grid_mass, grid_vel):
+    """ 粒子の質量・運動量（MLSなら応力とアフィン運動量も）をグリッドへ散布する
+
+    grid_vel には速度ではなく運動量を足し込む（グリッドの更新で質量で割る）。
+    粒子がノードを書くのは自分のタイルと右・上・右上のタイルだけなので、タイルを (x, y) の偶奇で
+    4色に分け、同じ色のタイルを並列に処理すれば同じノードに2つのスレッドが書き込むことはない。
+    """
+    n_grid = grid_mass.shape[0]
+    n_tiles = (n_grid + tile_size - 1) // tile_size
+    d_inv = d_inv_coef / (dx * dx)
+    for color in range(4):
+        cy, cx = color // 2, color % 2
+        nx = (n_tiles - cx + 1) // 2
+        ny = (n_tiles - cy + 1) // 2
+        for k in prange(nx * ny):
+            t = (cy + 2 * (k // nx)) * n_tiles + cx + 2 * (k % nx)
+            for q in range(tile_start[t], tile_start[t + 1]):
+                p = order[q]
+                gx, gy = pos[p, 0] / dx, pos[p, 1] / dx
+                base_x, base_y = math.floor(gx - shift), math.floor(gy - shift)
+                fx, fy = gx - base_x, gy - base_y
+                m = mass[p]
+                # アフィン運動量 m C と応力項 -dt V₀ P Fᵀ（PICではどちらも0）
+                a00 = a01 = a10 = a11 = 0.0
+                f00 = f01 = f10 = f11 = 0.0
+                if elastic:
+                    a00, a01, a10, a11 = m * C[p, 0, 0], m * C[p, 0, 1], m * C[p, 1, 0], m * C[p, 1, 1]
+                    F00, F01, F10, F11 = F[p, 0, 0], F[p, 0, 1], F[p, 1, 0], F[p, 1, 1]
+                    J = F00 * F11 - F01 * F10
+                    # F⁻ᵀ と P = μ (F - F⁻ᵀ) + λ log J F⁻ᵀ
+                    i00, i01, i10, i11 = F11 / J, -F10 / J, -F01 / J, F00 / J
+                    log_J = math.log(J)
+                    P00 = mu * (F00 - i00) + lam * log_J * i00
+                    P01 = mu * (F01 - i01) + lam * log_J * i01
+                    P10 = mu * (F10 - i10) + lam * log_J * i10
+                    P11 = mu * (F11 - i11) + lam * log_J * i11
+                    kv = -dt * volume[p]
+                    f00 = kv * (P00 * F00 + P01 * F01)
+                    f01 = kv * (P00 * F10 + P01 * F11)
+                    f10 = kv * (P10 * F00 + P11 * F01)
+                    f11 = kv * (P10 * F10 + P11 * F11)
+                for i in range(support):
+                    node_y = base_y + i
+                    if node_y < 0 or node_y >= n_grid:
+                        continue
+                    wy, dwy = kernel_weight(kernel_id, fy - i)
+                    for j in range(support):
+                        node_x = base_x + j
+                        if node_x < 0 or node_x >= n_grid:
+                            continue
+                        wx, dwx = kernel_weight(kernel_id, fx - j)
+                        w = wx * wy
+                        dpx, dpy = (j - fx) * dx, (i - fy) * dx
+                        if d_inv_coef > 0.0:
+                            grad_x, grad_y = d_inv * w * dpx, d_inv * w * dpy
+                        else:
+                            grad_x, grad_y = dwx * wy / dx, wx * dwy / dx
+                        grid_mass[node_y, node_x] += w * m
+                        grid_vel[node_y, node_x, 0] += (w * (m * vel[p, 0] + a00 * dpx + a01 * dpy)
+                                                        + f00 * grad_x + f01 * grad_y)
+                        grid_vel[node_y, node_x, 1] += (w * (m * vel[p, 1] + a10 * dpx + a11 * dpy)
+                                                        + f10 * grad_x + f11 * grad_y)
+
+
+@njit(parallel=True)
+def grid_update_kernel(tiles, tile_size, grid_mass, grid_vel, gravity, dt, boundary_nodes):
+    """ tiles に並べたタイルのノードについて、速度への変換・重力・4方の壁をまとめて行う """
+    n_grid = grid_mass.shape[0]
+    n_tiles = (n_grid + tile_size - 1) // tile_size
+    b = boundary_nodes
+    for k in prange(tiles.shape[0]):
+        ty, tx = tiles[k] // n_tiles, tiles[k] % n_tiles
+        for y in range(ty * tile_size, min((ty + 1) * tile_size, n_grid)):
+            for x in range(tx * tile_size, min((tx + 1) * tile_size, n_grid)):
+                m = grid_mass[y, x]
+                vx, vy = grid_vel[y, x, 0], grid_vel[y, x, 1]
+                # 質量が0のままの速度は0のまま
+                if m > 1e-10:
+                    vx /= m
+                    vy /= m
+                    vy += dt * gravity
+                # 壁の外向きに進もうとしたら止める
+                if (x < b and vx < 0.0) or (x >= n_grid - b and vx > 0.0):
+                    vx = 0.0
+                if (y < b and vy < 0.0) or (y >= n_grid - b and vy > 0.0):
+                    vy = 0.0
+                grid_vel[y, x, 0] = vx
+                grid_vel[y, x, 1] = vy
+
+
+@njit(parallel=True)
+def g2p_kernel(pos, vel, F, C, kernel_id, support, shift, d_inv_coef, elastic, dx, dt, grid_vel):
+    """ グリッドの速度（MLSならアフィン行列も）を集め、変形勾配と位置を更新する """
+    n_grid = grid_vel.shape[0]
+    d_inv = d_inv_coef / (dx * dx)
+    for p in prange(pos.shape[0]):
+        gx, gy = pos[p, 0] / dx, pos[p, 1] / dx
+        base_x, base_y = math.floor(gx - shift), math.floor(gy - shift)
+        fx, fy = gx - base_x, gy - base_y
+        vx = vy = 0.0
+        c00 = c01 = c10 = c11 = 0.0
+        for i in range(support):
+            node_y = base_y + i
+            if node_y < 0 or node_y >= n_grid:
+                continue
+            wy, dwy = kernel_weight(kernel_id, fy - i)
+            for j in range(support):
+                node_x = base_x + j
+                if node_x < 0 or node_x >= n_grid:
+                    continue
+                wx, dwx = kernel_weight(kernel_id, fx - j)
+                w = wx * wy
+                nvx, nvy = grid_vel[node_y, node_x, 0], grid_vel[node_y, node_x, 1]
+                vx += w * nvx
+                vy += w * nvy
+                if elastic:
+                    if d_inv_coef > 0.0:
+                        grad_x, grad_y = d_inv * w * (j - fx) * dx, d_inv * w * (i - fy) * dx
+                    else:
+                        grad_x, grad_y = dwx * wy / dx, wx * dwy / dx
+                    c00 += nvx * grad_x
+                    c01 += nvx * grad_y
+                    c10 += nvy * grad_x
+                    c11 += nvy * grad_y
+        vel[p, 0], vel[p, 1] = vx, vy
+        if elastic:
+            C[p, 0, 0], C[p, 0, 1], C[p, 1, 0], C[p, 1, 1] = c00, c01, c10, c11
+            # F ← (I + dt C) F
+            F00, F01, F10, F11 = F[p, 0, 0], F[p, 0, 1], F[p, 1, 0], F[p, 1, 1]
+            F[p, 0, 0] = (1.0 + dt * c00) * F00 + dt * c01 * F10
+            F[p, 0, 1] = (1.0 + dt * c00) * F01 + dt * c01 * F11
+            F[p, 1, 0] = dt * c10 * F00 + (1.0 + dt * c11) * F10
+            F[p, 1, 1] = dt * c10 * F01 + (1.0 + dt * c11) * F11
+        pos[p, 0] += dt * vx
+        pos[p, 1] += dt * vy
+
+
+class FusedStep:
+    """ Simulation の1ステップ（P2G・グリッド更新・G2P）をコンパイル済みカーネルで行う
+
+    フェーズごとの時間を測れるように、3つのカーネルは別々のメソッドから呼ぶ。
+    グリッドは TILE_SIZE 四方のタイルに分け、粒子のいるタイルとその右・上・右上のタイル
+    （粒子が書き込むノードがあるタイル）だけを0にして更新する。それ以外のノードは0のまま。
+    """
+
+    def __init__(self, kernel, material, n_grid, dx, boundary_nodes, dtype=np.float64):
+        if not AVAILABLE:
+            raise ValueError("the jit backend requires numba")
+        _, self.support, self.shift, d_inv_coef = transfer.KERNELS[kernel]
+        self.kernel_id = KERNEL_IDS[kernel]
+        self.d_inv_coef = 0.0 if d_inv_coef is None else d_inv_coef
+        self.elastic = material is not None
+        self.mu = material.mu if self.elastic else 0.0
+        self.lam = material.lam if self.elastic else 0.0
+        self.dx = dx
+        self.boundary_nodes = boundary_nodes
+        self.n_tiles = -(-n_grid // TILE_SIZE)
+        self.tile_start = np.zeros(self.n_tiles * self.n_tiles + 1, dtype=np.int64)
+        # 前のステップで使ったタイル（次のステップで0に戻す）。None なら最初のステップでグリッド全体を0にする
+        # （チェックポイントから復元したグリッドなど、どこに値が入っているか分からないため）
+        self.tiles = None
+        self.tile_of = None
+        self.order = None
+
+    def p2g(self, particles, dt, grid_mass, grid_vel):
+        p = particles
+        n = len(p)
+        if self.order is None or self.order.shape[0] != n:
+            self.tile_of = np.empty(n, dtype=np.int64)
+            self.order = np.empty(n, dtype=np.int64)
+        bin_particles(p.pos, self.shift, self.dx, TILE_SIZE, self.n_tiles, self.tile_of, self.tile_start,
+                      self.order)
+        # 粒子のいるタイルと、その右・上・右上のタイル
+        occupied = (np.diff(self.tile_start) > 0).reshape(self.n_tiles, self.n_tiles)
+        touched = occupied.copy()
+        touched[:, 1:] |= occupied[:, :-1]
+        touched[1:, :] |= occupied[:-1, :]
+        touched[1:, 1:] |= occupied[:-1, :-1]
+        tiles = np.flatnonzero(touched)
+        # 前のステップで書いたタイルも0に戻し、使っていないノードを0のままにする
+        if self.tiles is None:
+            grid_mass[:] = 0.0
+            grid_vel[:] = 0.0
+        else:
+            clear_tiles(np.union1d(self.tiles, tiles), TILE_SIZE, grid_mass, grid_vel)
+        self.tiles = tiles
+        p2g_kernel(p.pos, p.vel, p.mass, p.volume, p.F, p.C, self.kernel_id, self.support, self.shift,
+                   self.d_inv_coef, self.elastic, self.mu, self.lam, self.dx, dt, TILE_SIZE, self.tile_start,
+                   self.order, grid_mass, grid_vel)
+
+    def grid_update(self, dt, gravity, grid_mass, grid_vel):
+        grid_update_kernel(self.tiles, TILE_SIZE, grid_mass, grid_vel, gravity, dt, self.boundary_nodes)
+
+    def g2p(self, particles, dt, grid_vel):
+        p = particles
+        g2p_kernel(p.pos, p.vel, p.F, p.C, self.kernel_id, self.support, self.shift, self.d_inv_coef,
+                   self.elastic, self.dx, dt, grid_vel)
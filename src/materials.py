@@ -0,0 +1,44 @@
+import numpy as np
+
+
+class NeoHookean:
+    """ 圧縮性Neo-Hookean弾性体
+
+    P(F) = μ (F - F⁻ᵀ) + λ log J F⁻ᵀ
+    を (N, 2, 2) の変形勾配に対してまとめて計算する。
+    """
+
+    def __init__(self, youngs_modulus=2e5, poisson_ratio=0.2):
+        self.youngs_modulus = youngs_modulus
+        self.poisson_ratio = poisson_ratio
+        # ラメ定数
+        self.mu = youngs_modulus / (2.0 * (1.0 + poisson_ratio))
+        self.lam = youngs_modulus * poisson_ratio / ((1.0 + poisson_ratio) * (1.0 - 2.0 * poisson_ratio))
+
+    def first_piola(self, F):
+        """ 第1Piola-Kirchhoff応力 P (N, 2, 2) """
+        F_inv_T = np.linalg.inv(F).transpose(0, 2, 1)
+        log_J = np.log(np.linalg.det(F))
+        return self.mu * (F - F_inv_T) + self.lam * log_J[:, np.newaxis, np.newaxis] * F_inv_T
+
+    def energy_density(self, F):
+        """ ひずみエネルギー密度 ψ(F) = μ/2 (tr(FᵀF) - 2) - μ log J + λ/2 (log J)² (N,)（P = ∂ψ/∂F） """
+        log_J = np.log(np.linalg.det(F))
+        return 0.5 * self.mu * (np.einsum("nij,nij->n", F, F) - 2.0) - self.mu * log_J + 0.5 * self.lam * log_J**2
+
+    def first_piola_differential(self, dF, F_inv_T, log_J):
+        """ 変形勾配が dF (N, 2, 2) だけ変わったときの P の変化
+
+        dP = μ dF + (μ - λ log J) F⁻ᵀ dFᵀ F⁻ᵀ + λ tr(F⁻¹ dF) F⁻ᵀ
+        陰解法の反復で何度も呼ぶので、F⁻ᵀ と log J は F から一度だけ計算して渡す。
+        """
+        trace = np.einsum("nji,nji->n", F_inv_T, dF)
+        dP = F_inv_T @ dF.transpose(0, 2, 1) @ F_inv_T
+        dP *= (self.mu - self.lam * log_J)[:, np.newaxis, np.newaxis]
+        dP += self.mu * dF
+        dP += (self.lam * trace)[:, np.newaxis, np.newaxis] * F_inv_T
+        return dP
+
+    def wave_speed(self, density):
+        """ 縦波（P波）の速さ sqrt((λ + 2μ) / ρ)。CFL条件の dt の上限に使う """
+        return np.sqrt((self.lam + 2.0 * self.mu) / density)
@@ -0,0 +1,105 @@
+import numpy as np
+
+# 自分のセルと「半分」の隣接セル (dy, dx)。ペアを二重に数えないため残り半分は見ない
+HALF_SHELL = [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]
+# セルの数が粒子数のこの倍までなら、セルごとの粒子の範囲を表にする
+DENSE_CELLS_PER_PARTICLE = 4
+
+
+def candidate_pairs(pos, cell_size):
+    """ 一様グリッド（セルリスト / 空間ハッシュ）で衝突候補のペアを求める
+
+    cell_size 以上離れた粒子同士はペアにならない。
+    戻り値は i < j を区別しないインデックス配列 (i, j) のタプル（各ペアは1回ずつ）。
+    """
+    n = pos.shape[0]
+    if n < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+
+    # 各粒子が属するセルを計算し、隣接セルのオフセットで範囲外にならないよう1つずらす
+    cells = np.floor(pos / cell_size).astype(np.int64)
+    cells -= cells.min(axis=0)
+    cells += 1
+    nx, ny = cells.max(axis=0) + 2
+    key = cells[:, 1] * nx + cells[:, 0]
+
+    # セル番号順に並べる
+    order = np.argsort(key, kind="stable")
+    sorted_key = key[order]
+    index = np.arange(n)
+    # セルの数が粒子数に比べて多すぎなければ、各セルの粒子の範囲 [cell_start[c], cell_start[c + 1]) を
+    # 表にしておく（多ければ範囲を二分探索で求める）
+    cell_start = None
+    if nx * ny <= DENSE_CELLS_PER_PARTICLE * n:
+        cell_start = np.zeros(nx * ny + 1, dtype=np.int64)
+        np.cumsum(np.bincount(key, minlength=nx * ny), out=cell_start[1:])
+
+    pairs_i, pairs_j = [], []
+    for dy, dx in HALF_SHELL:
+        neighbor_key = sorted_key + (dy * nx + dx)
+        if cell_start is not None:
+            start = cell_start[neighbor_key]
+            end = cell_start[neighbor_key + 1]
+        else:
+            start = np.searchsorted(sorted_key, neighbor_key, side="left")
+            end = np.searchsorted(sorted_key, neighbor_key, side="right")
+        if dy == 0 and dx == 0:
+            # 同じセル内は自分より後ろの粒子だけ
+            start = index + 1
+        counts = np.maximum(end - start, 0)
+        total = counts.sum()
+        if total == 0:
+            continue
+        a = np.repeat(index, counts)
+        # 各ペアがセル範囲の何番目かを求めて、相手のインデックスを作る
+        b = np.arange(total) + np.repeat(start - (np.cumsum(counts) - counts), counts)
+        pairs_i.append(order[a])
+        pairs_j.append(order[b])
+
+    if not pairs_i:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+
+def contact_pairs(pos, radius, skin=0.0):
+    """ 接触距離（半径の合計）+ skin より近いペア (i, j) と、ペアごとの接触距離を返す """
+    n = pos.shape[0]
+    if n < 2:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    # セルの大きさは衝突しうる最大距離
+    i, j = candidate_pairs(pos, 2.0 * radius.max() + skin)
+    contact = radius[i] + radius[j]
+    d = pos[j] - pos[i]
+    near = np.flatnonzero(np.einsum("ij,ij->i", d, d) < (contact + skin)**2)
+    return i[near], j[near], contact[near]
+
+
+def spring_forces(pos, contact, i, j, k_spring, out=None):
+    """ ペアのリストに対してバネによる反発力をまとめて計算し、粒子ごとの合力 (N, 2) を返す
+
+    contact はペアごとの接触距離（半径の合計）。out を渡すとそこに足し込む。
+    """
+    n = pos.shape[0]
+    x, y = pos[:, 0], pos[:, 1]
+    dx = x[j] - x[i]
+    dy = y[j] - y[i]
+    dist_sq = dx * dx + dy * dy
+
+    # 粒子同士が衝突しているペアだけを残す
+    hit = np.flatnonzero((dist_sq < contact * contact) & (dist_sq > 0.0))
+    i, j = i[hit], j[hit]
+    dist = np.sqrt(dist_sq[hit])
+
+    # 反発力の大きさ（重なり量に比例）を距離で割ったものをかけて、向き（i から j へ）をつける
+    scale = k_spring * (contact[hit] - dist) / dist
+    if out is None:
+        out = np.zeros((n, 2))
+    # 作用・反作用で両方の粒子に加える
+    for c, d in enumerate((dx, dy)):
+        f = scale * d[hit]
+        out[:, c] += np.bincount(j, weights=f, minlength=n)
+        out[:, c] -= np.bincount(i, weights=f, minlength=n)
+    return out
@@ -0,0 +1,144 @@
+""" フレームごとの粒子の状態をバックグラウンドのスレッドでディスクに書き出す
+
+write(sim) はその時点の配列を（必要なら float16 に落として）コピーしてキューに入れるだけで、
+圧縮とファイルへの書き込みは別スレッドが行う。キューが満杯のときだけ待たされる。
+ディスク上は chunk_frames フレームずつまとめた chunk_00000.npz と、
+各フレームのステップ数・時刻・チャンクを並べた index.json になる。
+"""
+import json
+import os
+import queue
+import threading
+import zipfile
+
+import numpy as np
+
+INDEX_NAME = "index.json"
+
+
+def snapshot(sim, dtype, grid=False):
+    """ sim の現在の状態を書き出し用にコピーした {名前: 配列}
+
+    粒子を並べ替えるシミュレーション（particles.ids を持つもの）では、行 k がどのフレームでも
+    同じ粒子になるよう最初の番号順に並べ直す。
+    """
+    particles = {"pos": sim.positions(), "vel": sim.velocities()}
+    ids = getattr(getattr(sim, "particles", None), "ids", None)
+    arrays = {}
+    for name, a in particles.items():
+        a = np.asarray(a)
+        if ids is None:
+            arrays[name] = a.astype(dtype)
+        else:
+            # 並べ直しと型の変換を1回のコピーで済ませる
+            arrays[name] = np.empty(a.shape, dtype=dtype)
+            arrays[name][ids] = a
+    if grid and hasattr(sim, "dense_grid"):
+        # astype は常に新しい配列を返すので、シミュレーションが配列を書き換えても影響しない
+        for name, a in zip(("grid_mass", "grid_vel"), sim.dense_grid()):
+            arrays[name] = np.asarray(a).astype(dtype)
+    return arrays
+
+
+class FrameWriter:
+    """ シミュレーションのフレームを path（ディレクトリ）に書き出すライター
+
+    dtype: 保存する浮動小数点の型（"float16" で float64 の 1/4）
+    compress: チャンクを zlib で圧縮するか（compress_level は 1（速い）〜 9（小さい））
+    chunk_frames: 1つのファイルにまとめるフレーム数
+    queue_size: 書き込み待ちにできるフレーム数（満杯になると write() が待つ）
+    grid: MPMのグリッド（密な grid_mass, grid_vel）も保存するか
+    """
+
+    def __init__(self, path, dtype="float16", compress=True, compress_level=1, chunk_frames=32, queue_size=8,
+                 grid=False):
+        self.path = os.fspath(path)
+        self.dtype = np.dtype(dtype)
+        self.compress = compress
+        self.compress_level = compress_level
+        self.chunk_frames = chunk_frames
+        self.grid = grid
+        os.makedirs(self.path, exist_ok=True)
+        self.index = {"dtype": self.dtype.str, "frames": []}
+        self.frames_written = 0
+        self.error = None
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, name="FrameWriter", daemon=True)
+        self.thread.start()
+
+    def write(self, sim):
+        """ sim の現在の状態を1フレームとして書き出す（キューに入れてすぐ戻る） """
+        if self.error is not None:
+            raise RuntimeError("frame writer failed") from self.error
+        info = {"step": sim.step_count, "time": sim.time}
+        self.queue.put((info, snapshot(sim, self.dtype, self.grid)))
+
+    def close(self):
+        """ キューに残ったフレームを書き切ってスレッドを止める """
+        if self.thread.is_alive():
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is not None:
+            raise RuntimeError("frame writer failed") from self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _run(self):
+        chunk = []
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                chunk.append(item)
+                if len(chunk) == self.chunk_frames:
+                    self._write_chunk(chunk)
+                    chunk = []
+            if chunk:
+                self._write_chunk(chunk)
+        except Exception as e:
+            self.error = e
+            # write() が待ち続けないようにキューを空にしておく
+            while self.queue.get() is not None:
+                pass
+
+    def _write_chunk(self, chunk):
+        chunk_id = self.frames_written // self.chunk_frames
+        name = f"chunk_{chunk_id:05d}.npz"
+        arrays = {}
+        for k, (info, frame) in enumerate(chunk):
+            for field, a in frame.items():
+                arrays[f"{field}_{k:04d}"] = a
+            self.index["frames"].append(dict(info, chunk=name, key=k))
+        # 書きかけのファイルが残らないよう、別名で書いてから置き換える
+        tmp = os.path.join(self.path, name + ".tmp")
+        # np.savez_compressed は圧縮レベルを選べないので、同じ形式（.npy を入れたzip）を直接書く
+        method = zipfile.ZIP_DEFLATED if self.compress else zipfile.ZIP_STORED
+        with zipfile.ZipFile(tmp, "w", method, compresslevel=self.compress_level) as zf:
+            for key, a in arrays.items():
+                with zf.open(key + ".npy", "w", force_zip64=True) as f:
+                    np.lib.format.write_array(f, a, allow_pickle=False)
+        os.replace(tmp, os.path.join(self.path, name))
+        self.frames_written += len(chunk)
+        with open(os.path.join(self.path, INDEX_NAME), "w") as f:
+            json.dump(self.index, f)
+
+
+def read_frames(path, dtype=np.float64):
+    """ FrameWriter で書いたフレームを ({step, time}, {名前: 配列}) の順に返すジェネレータ """
+    path = os.fspath(path)
+    with open(os.path.join(path, INDEX_NAME)) as f:
+        index = json.load(f)
+    current_name, current = None, None
+    for frame in index["frames"]:
+        if frame["chunk"] != current_name:
+            current_name = frame["chunk"]
+            current = np.load(os.path.join(path, current_name))
+        suffix = f"_{frame['key']:04d}"
+        arrays = {key[:-len(suffix)]: current[key].astype(dtype)
+                  for key in current.files if key.endswith(suffix)}
+        yield {"step": frame["step"], "time": frame["time"]}, arrays
@@ -0,0 +1,155 @@
+""" MPMのP2G/G2Pを複数プロセスで並列に実行する
+
+粒子はMorton順に並べた配列を連続した区間に分けて各ワーカーに割り当てる
+（Morton順なので区間ごとに空間的にまとまった領域になる）。
+粒子の配列とグリッドは共有メモリに置き、P2Gでは各ワーカーが自分専用のグリッドへ
+散布して、メインプロセスがそれらを足し合わせてからグリッドの更新を行う。
+G2Pでは各ワーカーが担当区間の粒子を共有メモリ上で直接更新する。
+"""
+import multiprocessing as mp
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import transfer
+from particles import ParticleArrays
+
+START_METHOD = "spawn"  # ワーカーの起動方法（multiprocessing の start method）
+
+
+def create_shared(specs):
+    """ {名前: (形, dtype)} の配列を共有メモリ上に作り、(共有メモリ, 配列) の辞書を返す """
+    shms, arrays = {}, {}
+    for name, (shape, dtype) in specs.items():
+        dtype = np.dtype(dtype)
+        nbytes = max(int(np.prod(shape)) * dtype.itemsize, 1)
+        shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        shms[name] = shm
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return shms, arrays
+
+
+def attach_shared(layout):
+    """ create_shared で作った共有メモリに別プロセスから接続する """
+    shms, arrays = {}, {}
+    for name, (shm_name, shape, dtype) in layout.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        shms[name] = shm
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    return shms, arrays
+
+
+def worker_main(conn, layout, index, kernel, material, dx, n_grid):
+    """ ワーカープロセスの本体。("p2g" | "g2p", 開始, 終了, dt) を受け取って処理する """
+    shms, arrays = attach_shared(layout)
+    particles = object.__new__(ParticleArrays)
+    for name in ParticleArrays.FIELDS:
+        setattr(particles, name, arrays[name])
+    partial = arrays["partial"][index]  # このワーカー専用のグリッド (n, n, 3)
+    grid_vel = arrays["grid_vel"]
+    # 重みはP2Gで計算したものをG2Pでも使う（同じ区間を同じワーカーが担当する）
+    cache = transfer.TransferWeights(kernel)
+    try:
+        while True:
+            command, start, end, dt = conn.recv()
+            if command == "close":
+                break
+            part = particles.view(start, end)
+            if command == "p2g":
+                cache.update(part.pos, dx, n_grid)
+                transfer.particle_to_grid(cache, part, material, dt, partial[..., 0], partial[..., 1:])
+            elif command == "g2p":
+                transfer.grid_to_particle(cache, part, material, dt, grid_vel)
+            conn.send(None)
+    finally:
+        # 共有メモリ上の配列への参照を消してから閉じる
+        del particles, partial, grid_vel, arrays
+        for shm in shms.values():
+            shm.close()
+
+
+def shutdown(processes, connections, shms):
+    for conn in connections:
+        try:
+            conn.send(("close", 0, 0, 0.0))
+        except (BrokenPipeError, OSError):
+            pass
+    for process in processes:
+        process.join()
+    for shm in shms.values():
+        try:
+            shm.close()
+        except BufferError:
+            # まだ配列から参照されている場合は閉じずに名前だけ消す
+            pass
+        shm.unlink()
+
+
+class ParallelExecutor:
+    """ Simulation の粒子配列とグリッドを共有メモリに移し、P2G/G2Pをワーカーに分担させる """
+
+    def __init__(self, sim, n_workers):
+        self.sim = sim
+        self.n_workers = n_workers
+        p = sim.particles
+        n = sim.n_grid
+
+        specs = {name: (getattr(p, name).shape, getattr(p, name).dtype) for name in ParticleArrays.FIELDS}
+        dtype = sim.grid_vel.dtype
+        specs["grid_vel"] = ((n, n, 2), dtype)
+        specs["partial"] = ((n_workers, n, n, 3), dtype)
+        self.shms, self.arrays = create_shared(specs)
+
+        # シミュレーション側の配列を共有メモリ上のものに差し替える
+        for name in ParticleArrays.FIELDS:
+            self.arrays[name][:] = getattr(p, name)
+            setattr(p, name, self.arrays[name])
+        self.arrays["grid_vel"][:] = sim.grid_vel
+        sim.grid_vel = self.arrays["grid_vel"]
+        self.reduced = np.zeros((n, n, 3), dtype=dtype)
+
+        layout = {name: (shm.name, self.arrays[name].shape, self.arrays[name].dtype.str)
+                  for name, shm in self.shms.items()}
+        self.connections, self.processes = [], []
+        # fork だと、jit のスレッド（numba のスレッドプール）が動いたあとのプロセスを複製して止まることがある
+        context = mp.get_context(START_METHOD)
+        for k in range(n_workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=worker_main, daemon=True,
+                                 args=(child_conn, layout, k, sim.weights.kernel, sim.material, sim.dx, n))
+            process.start()
+            self.connections.append(parent_conn)
+            self.processes.append(process)
+        # 終了時に必ずワーカーを止めて共有メモリを解放する
+        self._finalizer = weakref.finalize(self, shutdown, self.processes, self.connections, self.shms)
+
+    def bounds(self):
+        """ 各ワーカーが担当する粒子の区間の境目 """
+        return np.linspace(0, len(self.sim.particles), self.n_workers + 1).astype(int)
+
+    def run(self, command, dt):
+        bounds = self.bounds()
+        for k, conn in enumerate(self.connections):
+            conn.send((command, int(bounds[k]), int(bounds[k + 1]), dt))
+        for conn in self.connections:
+            conn.recv()
+
+    def p2g(self, dt):
+        self.run("p2g", dt)
+        # 各ワーカーのグリッドを足し合わせる
+        np.sum(self.arrays["partial"], axis=0, out=self.reduced)
+        self.sim.grid_mass[:] = self.reduced[..., 0]
+        self.sim.grid_vel[:] = self.reduced[..., 1:]
+
+    def g2p(self, dt):
+        self.run("g2p", dt)
+
+    def close(self):
+        """ ワーカーを止め、シミュレーションの配列を通常のメモリに戻す """
+        p = self.sim.particles
+        for name in ParticleArrays.FIELDS:
+            setattr(p, name, getattr(p, name).copy())
+        self.sim.grid_vel = self.sim.grid_vel.copy()
+        self.arrays = None
+        self._finalizer()
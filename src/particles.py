@@ -0,0 +1,78 @@
+import numpy as np
+
+
+def part1by1(v):
+    """ 16ビット整数のビットを1つおきに広げる（Morton符号用） """
+    v = v.astype(np.uint64) & np.uint64(0xFFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x33333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x55555555)
+    return v
+
+
+def morton_order(pos, dx):
+    """ 粒子が属するセルのMorton（Z-order）符号で並べたときの順番を返す """
+    cell = np.clip(np.floor(pos / dx), 0, 0xFFFF).astype(np.uint64)
+    key = part1by1(cell[:, 0]) | (part1by1(cell[:, 1]) << np.uint64(1))
+    return np.argsort(key, kind="stable")
+
+
+class ParticleArrays:
+    """ 粒子の状態を連続したNumPy配列（構造体配列, SoA）として保持するコンテナ
+
+    浮動小数点の配列は dtype（float64 か float32）でそろえる。
+    """
+
+    # 粒子ごとの配列の名前
+    FIELDS = ("pos", "vel", "mass", "volume", "F", "C", "ids")
+    # 浮動小数点の配列（astype で型を変えるもの）
+    FLOAT_FIELDS = ("pos", "vel", "mass", "volume", "F", "C")
+
+    def __init__(self, n, mass=1.0, volume=1.0, dtype=np.float64):
+        self.pos = np.zeros((n, 2), dtype=dtype)     # 位置 (N, 2)
+        self.vel = np.zeros((n, 2), dtype=dtype)     # 速度 (N, 2)
+        self.mass = np.full(n, mass, dtype=dtype)  # 質量 (N,)
+        self.volume = np.full(n, volume, dtype=dtype)  # 初期体積 (N,)
+        # 変形勾配 F (N, 2, 2)、初期値は単位行列
+        self.F = np.tile(np.eye(2, dtype=dtype), (n, 1, 1))
+        # アフィン運動量行列 C (N, 2, 2)（APIC/MLS-MPM用）
+        self.C = np.zeros((n, 2, 2), dtype=dtype)
+        # 各粒子の最初の番号（並べ替えても外部の粒子ごとのデータと対応が取れるように）
+        self.ids = np.arange(n)
+
+    def __len__(self):
+        return self.pos.shape[0]
+
+    @property
+    def dtype(self):
+        return self.pos.dtype
+
+    def astype(self, dtype):
+        """ 浮動小数点の配列を dtype に変換する（すでにその型なら何もしない） """
+        for name in self.FLOAT_FIELDS:
+            setattr(self, name, getattr(self, name).astype(dtype, copy=False))
+        return self
+
+    def reorder(self, order):
+        """ 全ての配列を order の順に並べ替える（配列そのものは差し替えずに中身を書き換える） """
+        for name in self.FIELDS:
+            array = getattr(self, name)
+            array[:] = array[order]
+
+    def view(self, start, end):
+        """ start から end までの粒子を参照する（コピーしない）コンテナを返す """
+        part = object.__new__(ParticleArrays)
+        for name in self.FIELDS:
+            setattr(part, name, getattr(self, name)[start:end])
+        return part
+
+    @classmethod
+    def from_positions(cls, pos, vel=None, mass=1.0, volume=1.0, dtype=np.float64):
+        """ 位置の配列 (N, 2) から粒子コンテナを作る """
+        pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+        particles = cls(pos.shape[0], mass, volume, dtype)
+        particles.pos[:] = pos
+        if vel is not None:
+            particles.vel[:] = vel
+        return particles
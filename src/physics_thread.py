@@ -0,0 +1,114 @@
+""" 物理計算を別スレッドで回し、完成した状態をトリプルバッファで描画側に渡す
+
+物理スレッドは1フレーム分進めるたびに、粒子の位置を3つあるバッファのうち
+「最新」でも「描画中」でもないものへコピーしてから最新として公開する。描画側は最新の
+バッファをそのまま（コピーせずに）読むので、物理計算を止めることも、書きかけの状態を見ることもない。
+ロックはバッファの番号を入れ替える間だけ取る。
+"""
+import threading
+import time
+
+import numpy as np
+
+N_BUFFERS = 3
+
+
+class StateBuffer:
+    """ 物理スレッドが書き、描画側が読む状態のトリプルバッファ
+
+    各バッファは {"pos": 配列, "step_count", "time", "version"}。version は公開するたびに増える。
+    """
+
+    def __init__(self, n_buffers=N_BUFFERS):
+        if n_buffers < 3:
+            raise ValueError("a state buffer needs at least 3 buffers")
+        self.slots = [None] * n_buffers
+        self.lock = threading.Lock()
+        self.latest = None     # 最新の完成した状態のバッファ番号
+        self.reading = None    # 描画側が読んでいるバッファ番号
+        self.version = 0
+
+    def publish(self, sim):
+        """ sim の今の状態を空いているバッファに書いて最新にする（物理スレッドから呼ぶ） """
+        with self.lock:
+            k = next(k for k in range(len(self.slots)) if k != self.latest and k != self.reading)
+        pos = sim.positions()
+        slot = self.slots[k]
+        if slot is None or slot["pos"].shape != pos.shape or slot["pos"].dtype != pos.dtype:
+            slot = self.slots[k] = {"pos": np.empty_like(pos)}
+        np.copyto(slot["pos"], pos)
+        slot["step_count"], slot["time"] = sim.step_count, sim.time
+        with self.lock:
+            self.version += 1
+            slot["version"] = self.version
+            self.latest = k
+
+    def acquire(self):
+        """ 最新の状態を返す（次に acquire するまで書き換えられない）。まだなければ None """
+        with self.lock:
+            self.reading = self.latest
+            return None if self.latest is None else self.slots[self.latest]
+
+
+class PhysicsThread:
+    """ advance(frame_start) で1フレーム分ずつ sim を進め、そのたびに状態を buffer に公開するスレッド
+
+    frame_time（秒）を渡すと、1フレームがそれより早く終わったときだけ残りを待つ
+    （シミュレーション時間を実時間に合わせる）。0（既定）なら待たずに全速力で進める。
+    outputs（FrameWriter や history.FrameHistory など write(sim) を持つもの）には、公開するたびにその状態を書く。
+    pause() はフレームの切れ目で止まるまで待つので、そのあとは sim や outputs を安全に読める。
+    """
+
+    def __init__(self, sim, advance, buffer, frame_time=0.0, outputs=()):
+        self.sim = sim
+        self.advance = advance
+        self.buffer = buffer
+        self.frame_time = frame_time
+        self.outputs = list(outputs)
+        self.error = None
+        self.stopping = threading.Event()
+        self.paused = threading.Event()
+        self.idle = threading.Event()   # 一時停止してフレームの切れ目で待っている
+        self.thread = threading.Thread(target=self._run, name="PhysicsThread", daemon=True)
+
+    def start(self):
+        # 描画側が最初のフレームから描けるように、最初の状態を公開しておく
+        self.buffer.publish(self.sim)
+        self.thread.start()
+
+    def pause(self):
+        """ 今のフレームが終わったところで止める（止まるまで待つ） """
+        self.paused.set()
+        while self.thread.is_alive() and not self.idle.wait(0.05):
+            pass
+
+    def resume(self):
+        self.idle.clear()
+        self.paused.clear()
+
+    def stop(self):
+        """ 進めているフレームが終わるのを待ってスレッドを止める """
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join()
+        if self.error is not None:
+            raise RuntimeError("physics thread failed") from self.error
+
+    def _run(self):
+        try:
+            while not self.stopping.is_set():
+                if self.paused.is_set():
+                    self.idle.set()
+                    self.stopping.wait(self.frame_time or 0.01)
+                    continue
+                frame_start = time.perf_counter()
+                self.advance(frame_start)
+                self.buffer.publish(self.sim)
+                for output in self.outputs:
+                    output.write(self.sim)
+                if self.frame_time > 0.0:
+                    remaining = self.frame_time - (time.perf_counter() - frame_start)
+                    if remaining > 0.0:
+                        self.stopping.wait(remaining)
+        except Exception as e:
+            self.error = e
@@ -0,0 +1,153 @@
+import numpy as np
+
+
+def hex_to_rgb(color):
+    """ "#RRGGBB" 形式の色を (R, G, B) に変換する """
+    color = color.lstrip("#")
+    return tuple(int(color[k:k + 2], 16) for k in (0, 2, 4))
+
+
+def to_pixels(pos, win_x, win_y):
+    """ 正規化座標 (N, 2) -> 一番近いピクセルの座標 (px, py) """
+    px = np.rint(pos[:, 0] * win_x).astype(np.int64)
+    py = np.rint((1.0 - pos[:, 1]) * win_y).astype(np.int64)
+    return px, py
+
+
+def disc_offsets(radius):
+    """ 半径 radius ピクセルの円に含まれる画素のオフセット (dy, dx) """
+    r = int(np.ceil(radius))
+    dy, dx = np.mgrid[-r:r + 1, -r:r + 1]
+    inside = dy**2 + dx**2 <= radius**2
+    return dy[inside], dx[inside]
+
+
+class RasterRenderer:
+    """ 全粒子を1枚のRGB画像 (NumPy配列) にラスタライズする
+
+    格子点のような動かないものは背景レイヤーとして初回に1度だけ描いておき、
+    毎フレームは背景をコピーして粒子だけを上書きする。
+    粒子が多いときは粒子ごとに円を塗る代わりに、粒子の中心だけを書いた画像を
+    円の形で膨張させるので、1フレームのコストが粒子数にほぼ依存しない。
+    """
+
+    def __init__(self, win_x, win_y, bg="#4D4D4D", particle_radius_px=5, colors="#06D6A0"):
+        self.win_x, self.win_y = win_x, win_y
+        self.background = np.empty((win_y, win_x, 3), dtype=np.uint8)
+        self.background[:] = hex_to_rgb(bg)
+        self.frame = self.background.copy()
+        self.radius = int(np.ceil(particle_radius_px))
+        self.disc_dy, self.disc_dx = disc_offsets(particle_radius_px)
+        self.set_colors(colors)
+        # PPM形式のヘッダ（tkinter.PhotoImage に直接渡せる）
+        self.header = f"P6 {win_x} {win_y} 255 ".encode()
+
+    def set_colors(self, colors):
+        if isinstance(colors, str):
+            self.colors = np.array(hex_to_rgb(colors), dtype=np.uint8)
+            self.palette = self.colors[np.newaxis, :]
+            self.color_index = None
+        else:
+            self.colors = np.array([hex_to_rgb(c) for c in colors], dtype=np.uint8)
+            # 膨張処理用に、使われている色のパレットと粒子ごとのパレット番号を作る
+            self.palette, self.color_index = np.unique(self.colors, axis=0, return_inverse=True)
+            self.color_index = self.color_index.reshape(-1).astype(np.int32)
+
+    def to_pixels(self, pos):
+        return to_pixels(pos, self.win_x, self.win_y)
+
+    def stamp(self, image, pos, dy, dx, colors):
+        """ 各粒子の位置に円（オフセット dy, dx）を塗る """
+        px, py = self.to_pixels(pos)
+        ys = py[:, np.newaxis] + dy
+        xs = px[:, np.newaxis] + dx
+        inside = (0 <= xs) & (xs < self.win_x) & (0 <= ys) & (ys < self.win_y)
+        if colors.ndim == 1:
+            image[ys[inside], xs[inside]] = colors
+        else:
+            image[ys[inside], xs[inside]] = np.broadcast_to(colors[:, np.newaxis, :], ys.shape + (3,))[inside]
+
+    def dilate(self, image, pos):
+        """ 粒子の中心だけを書いた色番号マップを円の形に膨張させて塗る """
+        r = self.radius
+        px, py = self.to_pixels(pos)
+        # 画面外に中心がある粒子もはみ出た部分が描けるよう、半径分の余白を付ける
+        padded = np.full((self.win_y + 2 * r, self.win_x + 2 * r), -1, dtype=np.int32)
+        ys, xs = py + r, px + r
+        inside = (0 <= xs) & (xs < padded.shape[1]) & (0 <= ys) & (ys < padded.shape[0])
+        if self.color_index is None:
+            padded[ys[inside], xs[inside]] = 0
+        else:
+            padded[ys[inside], xs[inside]] = self.color_index[inside]
+
+        index_map = np.full((self.win_y, self.win_x), -1, dtype=np.int32)
+        for dy, dx in zip(self.disc_dy, self.disc_dx):
+            np.maximum(index_map, padded[r - dy:r - dy + self.win_y, r - dx:r - dx + self.win_x], out=index_map)
+        painted = index_map >= 0
+        image[painted] = self.palette[index_map[painted]]
+
+    def add_static_points(self, pos, radius, color):
+        """ 背景レイヤーに動かない点（格子点など）を描き込む """
+        dy, dx = disc_offsets(radius)
+        self.stamp(self.background, pos, dy, dx, np.array(hex_to_rgb(color), dtype=np.uint8))
+
+    def render(self, pos):
+        """ 粒子を描いた1フレーム分の画像を作り、PPMのバイト列として返す """
+        np.copyto(self.frame, self.background)
+        if len(pos) * len(self.disc_dy) > self.win_x * self.win_y:
+            self.dilate(self.frame, pos)
+        else:
+            self.stamp(self.frame, pos, self.disc_dy, self.disc_dx, self.colors)
+        return self.header + self.frame.tobytes()
+
+
+class ItemTracker:
+    """ 粒子ごとの図形（キャンバスの item）のうち、描き直す必要があるものを選ぶ
+
+    位置をピクセルに丸めて前回描いた位置と比べ、変わった粒子だけを返す（止まっている粒子には触らない）。
+    cull_px > 0 なら、中心が同じ cull_px 四方のブロックに入る粒子は最初の1つだけを描き、
+    残りは隠す（ほとんど重なっていて見分けがつかないので）。
+    """
+
+    def __init__(self, win_x, win_y, cull_px=0):
+        self.win_x, self.win_y = win_x, win_y
+        self.cull_px = cull_px
+        self.drawn = None   # 前回描いたピクセル位置 (N, 2)
+        self.shown = None   # 前回表示していたかどうか (N,)
+
+    def visible(self, px, py):
+        """ 重なりで隠さない粒子 (N,) """
+        if self.cull_px <= 0:
+            return np.ones(len(px), dtype=bool)
+        bx, by = px // self.cull_px, py // self.cull_px
+        # ブロック番号を1つの整数にまとめ、各ブロックで最初の粒子だけを残す
+        bx -= bx.min(initial=0)
+        by -= by.min(initial=0)
+        key = by * (bx.max(initial=0) + 1) + bx
+        first = np.unique(key, return_index=True)[1]
+        keep = np.zeros(len(px), dtype=bool)
+        keep[first] = True
+        return keep
+
+    def update(self, pos):
+        """ pos を描くために (動かす粒子, 表示に戻す粒子, 隠す粒子, px, py) を返す
+
+        動かす粒子は表示に戻す粒子を含む。最初の呼び出しではすべての粒子を動かす粒子として返す。
+        """
+        px, py = to_pixels(pos, self.win_x, self.win_y)
+        pixels = np.stack([px, py], axis=1)
+        visible = self.visible(px, py)
+        if self.drawn is None or len(self.drawn) != len(pixels):
+            self.drawn = pixels
+            self.shown = np.ones(len(pixels), dtype=bool)
+            hide = np.flatnonzero(~visible)
+            self.shown[hide] = False
+            return np.arange(len(pixels)), np.zeros(0, dtype=np.int64), hide, px, py
+        # 隠している粒子は動かさない（表示に戻すときに動かす）
+        changed = visible & (np.any(pixels != self.drawn, axis=1) | ~self.shown)
+        move = np.flatnonzero(changed)
+        show = np.flatnonzero(visible & ~self.shown)
+        hide = np.flatnonzero(~visible & self.shown)
+        self.drawn[move] = pixels[move]
+        self.shown = visible
+        return move, show, hide, px, py
@@ -0,0 +1,135 @@
+""" JSONで書いたシーン（物体の形・材料・初速度・パラメータ）からシミュレーションを作る
+
+シーンファイルの例（scenes/ を参照）:
+    {
+      "engine": "mpm",
+      "seed": 0,
+      "simulation": {"n_grid_side": 32, "gravity": -9.81, "cfl": 0.4, "kernel": "quadratic", "boundary_nodes": 3},
+      "material": {"type": "neo_hookean", "youngs_modulus": 2e5, "poisson_ratio": 0.2},
+      "bodies": [{"shape": "disc", "center": [0.5, 0.7], "radius": 0.2, "ppc": 4, "sampling": "jittered",
+                  "density": 1000.0, "velocity": [0.0, 0.0]}],
+      "run": {"sim_time": 1.0}
+    }
+
+engine は "mpm"（Simulation）か "dem"（DEMSimulation）。simulation の中身はそのまま
+コンストラクタの引数になる。物体の形と粒子の置き方は seeding.py を参照。壁は領域 [0, 1]² の4方にあり、MPMでは boundary_nodes で厚さを決める。
+MPMの粒子の体積は図形の面積を粒子数で等分したもので、density があれば質量 = 密度 × 体積、
+なければ mass（既定 1.0）を使う。DEMの物体は particle_radius で粒子の半径を決める。
+run はヘッドレス実行（sweep.py）で進める長さで、{"steps": N} か {"sim_time": T}。
+"""
+import copy
+import json
+
+import numpy as np
+
+import seeding
+from dem import DEMParticles, DEMSimulation
+from materials import NeoHookean
+from particles import ParticleArrays
+from simulation import Simulation
+
+# 材料の名前 -> クラス
+MATERIALS = {"neo_hookean": NeoHookean}
+DEFAULT_N_GRID = 32  # Simulation の n_grid_side の既定値（ppc から粒子の間隔を決めるのに使う）
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def set_value(scene, key, value):
+    """ "material.youngs_modulus" や "bodies.0.radius" のような点区切りの場所に値を入れる """
+    *parents, last = key.split(".")
+    node = scene
+    for part in parents:
+        node = node[int(part)] if isinstance(node, list) else node.setdefault(part, {})
+    if isinstance(node, list):
+        node[int(last)] = value
+    else:
+        node[last] = value
+
+
+def with_overrides(scene, overrides):
+    """ overrides（点区切りの場所 -> 値）を当てたシーンのコピーを返す """
+    scene = copy.deepcopy(scene)
+    for key, value in overrides.items():
+        set_value(scene, key, value)
+    return scene
+
+
+def seed_body(scene, index, body):
+    """ 物体の粒子の位置を置く
+
+    粒子の数は count（ちょうどの個数）、spacing（間隔）、ppc（MPMの格子1セルあたりの数）のどれかで決め、
+    置き方は sampling（既定 "jittered"、seeding.METHODS を参照）。乱数は (seed, 物体の番号) から作るので、
+    ほかの物体を変えても配置は変わらない。
+    """
+    rng = np.random.default_rng([scene.get("seed", 0), index])
+    method = body.get("sampling", "jittered")
+    if "count" in body:
+        return seeding.sample(body, rng, method, count=body["count"])
+    if "ppc" in body:
+        dx = 1.0 / scene.get("simulation", {}).get("n_grid_side", DEFAULT_N_GRID)
+        return seeding.sample(body, rng, method, spacing=seeding.spacing_for(body["ppc"], dx))
+    return seeding.sample(body, rng, method, spacing=body["spacing"])
+
+
+def seed_bodies(scene):
+    """ 全物体の粒子を置き、(位置, 速度, 物体ごとの設定と粒子数) を返す """
+    positions, velocities, bodies = [], [], []
+    for index, body in enumerate(scene.get("bodies", [])):
+        pos = seed_body(scene, index, body)
+        positions.append(pos)
+        velocities.append(np.broadcast_to(np.asarray(body.get("velocity", [0.0, 0.0]), dtype=float), pos.shape))
+        bodies.append((body, len(pos)))
+    if not positions:
+        return np.zeros((0, 2)), np.zeros((0, 2)), bodies
+    return np.concatenate(positions), np.concatenate(velocities), bodies
+
+
+def build_mpm(scene, options):
+    pos, vel, bodies = seed_bodies(scene)
+    particles = ParticleArrays.from_positions(pos, vel)
+    start = 0
+    for body, n in bodies:
+        volume = seeding.area(body) / max(n, 1)
+        mass = body["density"] * volume if "density" in body else body.get("mass", 1.0)
+        particles.volume[start:start + n] = volume
+        particles.mass[start:start + n] = mass
+        start += n
+
+    settings = dict(scene.get("simulation", {}))
+    material = scene.get("material")
+    if material is not None:
+        material = dict(material)
+        kind = material.pop("type", "neo_hookean")
+        if kind not in MATERIALS:
+            raise ValueError(f"unknown material: {kind} (choose from {', '.join(MATERIALS)})")
+        settings["material"] = MATERIALS[kind](**material)
+    settings.update(options)
+    return Simulation(particles, **settings)
+
+
+def build_dem(scene, options):
+    pos, vel, bodies = seed_bodies(scene)
+    particles = DEMParticles(pos, vel)
+    start = 0
+    for body, n in bodies:
+        particles.radius[start:start + n] = body["particle_radius"]
+        particles.mass[start:start + n] = body.get("mass", 1.0)
+        start += n
+    settings = dict(scene.get("simulation", {}))
+    settings.update(options)
+    return DEMSimulation(particles, **settings)
+
+
+def build(scene, **options):
+    """ シーンの辞書からシミュレーションを作る（options でコンストラクタの引数を上書きできる） """
+    engine = scene.get("engine", "mpm")
+    if engine == "mpm":
+        return build_mpm(scene, options)
+    if engine == "dem":
+        return build_dem(scene, options)
+    raise ValueError(f"unknown engine: {engine} (choose from mpm, dem)")
+
@@ -0,0 +1,254 @@
+import numpy as np
+
+import jit
+import parallel
+import timestep
+import transfer
+from implicit import ImplicitSolver
+from particles import morton_order
+from sparse_grid import SparseBlockGrid
+
+
+class Simulation:
+    """ MPMシミュレーションの本体（tkinterに依存しない）
+
+    main_loop から物理計算だけを切り出したもの。
+    step(n) で n ステップ進め、状態は positions() / velocities() などで参照する。
+    material を渡すと、MLS-MPM（APIC）で弾性体として解く。
+    material が None なら重力のみのPIC転送になる。
+    kernel は補間カーネル（"linear", "quadratic", "cubic"）で、重みと勾配は
+    1ステップに1度だけ計算してP2GとG2Pで共有する。
+    cfl を渡すと、各ステップの dt を最大速度・DX・弾性波の速さから決める（dt_max が上限）。
+    cfl が None なら dt 固定。
+    sparse_block_size を渡すと、グリッドは粒子のいるブロックだけを確保する疎な形で持つ
+    （このとき grid_mass / grid_vel は (有効ブロック数, b, b) の詰めた配列になる）。
+    sort_interval ステップごとに粒子の配列をセルのMorton順に並べ替え、P2G/G2Pでの
+    グリッドへのアクセスを連続に近づける。並べ替えの順番は last_order に、
+    各粒子の最初の番号は particles.ids に残る。
+    workers を渡すと、P2G/G2Pをそのプロセス数で並列に実行する（密なグリッドのみ）。
+    dtype（float64 か float32）で粒子とグリッドの浮動小数点の配列の型をそろえる。
+    float32 にするとメモリの読み書きの量が半分になる。
+    backend は "numpy" / "jit"（Numbaでコンパイルしたカーネルで1ステップをまとめて計算）/
+    "auto"（numba があり workers も疎なグリッドも使わないなら "jit"）。jit では密なグリッドを使う。
+    implicit を True にすると、弾性体のグリッドの速度を後退オイラーで解き直す（implicit.py）。
+    このとき dt は弾性波のCFL条件に縛られず、粒子の速さだけで決まる（numpy のみ）。
+    """
+
+    # 計測するフェーズ名 -> メソッド名（instrument.PhaseTimers.attach で使う）
+    PHASES = {"step": "substep", "sort": "sort_particles", "p2g": "_p2g", "grid_update": "_grid_update",
+              "implicit": "_implicit_solve", "boundary": "_boundary", "g2p": "_g2p"}
+
+    def __init__(self, particles, n_grid_side=32, dt=5e-4, gravity=-9.81, material=None,
+                 boundary_nodes=1, kernel="linear", cfl=None, dt_max=None, sparse_block_size=None,
+                 sort_interval=None, workers=None, backend="auto", dtype=np.float64, implicit=False):
+        self.dtype = np.dtype(dtype)
+        self.particles = particles.astype(self.dtype)
+        self.n_grid = n_grid_side
+        self.dx = 1.0 / n_grid_side
+        # fixed_dt は設定した dt、self.dt は直前のステップで使った dt
+        self.fixed_dt = dt
+        self.dt = dt
+        self.cfl = cfl
+        self.dt_max = dt_max
+        self.gravity = gravity
+        self.material = material
+        self.weights = transfer.TransferWeights(kernel)
+        # 壁の境界条件をかける外周ノードの幅
+        self.boundary_nodes = boundary_nodes
+        # 指定された backend（チェックポイントにはこちらを残す）と、実際に使う self.backend
+        self.requested_backend = backend
+        if backend == "auto":
+            dense = sparse_block_size is None
+            backend = "jit" if jit.AVAILABLE and dense and not workers and not implicit else "numpy"
+        if backend not in ("numpy", "jit"):
+            raise ValueError(f"unknown backend: {backend} (choose from auto, numpy, jit)")
+        if backend == "jit" and workers:
+            raise ValueError("workers can only be used with the numpy backend")
+        if backend == "jit" and sparse_block_size is not None:
+            raise ValueError("the jit backend uses a dense grid (set sparse_block_size=None)")
+        if implicit and (backend == "jit" or workers):
+            raise ValueError("implicit can only be used with the numpy backend without workers")
+        self.implicit = implicit
+        self.implicit_solver = None
+        if implicit and material is not None:
+            self.implicit_solver = ImplicitSolver(material)
+        self.backend = backend
+        self.fused_step = None
+        if backend == "jit":
+            self.fused_step = jit.FusedStep(kernel, material, n_grid_side, self.dx, boundary_nodes, self.dtype)
+        # 計算用のグリッドデータ
+        if sparse_block_size is None:
+            self.sparse = None
+            self.grid_mass = np.zeros((n_grid_side, n_grid_side), dtype=self.dtype)
+            self.grid_vel = np.zeros((n_grid_side, n_grid_side, 2), dtype=self.dtype)
+        else:
+            self.sparse = SparseBlockGrid(n_grid_side, sparse_block_size, self.dtype)
+            self.grid_mass, self.grid_vel = self.sparse.grid_mass, self.sparse.grid_vel
+        self.sort_interval = sort_interval
+        # 毎ステップ使い回す作業用の配列
+        self.mass_filter = None
+        self.speed_sq = None
+        if workers and sparse_block_size is not None:
+            raise ValueError("workers can only be used with a dense grid (sparse_block_size=None)")
+        self.workers = workers
+        self.executor = None
+        self.last_order = None
+        self.step_count = 0
+        self.time = 0.0
+        # 保存量のモニタ（diagnostics.Diagnostics.attach で設定する）
+        self.diagnostics = None
+        # 弾性波の速さ（粒子の中で最も密度が低いものが一番速い）
+        self.wave_speed = 0.0
+        if material is not None and len(particles):
+            self.wave_speed = float(material.wave_speed(np.min(particles.mass / particles.volume)))
+
+    def step(self, n=1):
+        """ n ステップ分シミュレーションを進める """
+        for _ in range(n):
+            self.substep(self.stable_dt())
+
+    def advance(self, duration):
+        """ シミュレーション時間を duration だけ進め、使ったサブステップ数を返す """
+        return timestep.advance(self, duration)
+
+    def stable_dt(self):
+        """ 次のステップで使う dt（固定 dt か、CFL条件から決めた最大の dt） """
+        if self.cfl is None:
+            return self.fixed_dt
+        vel = self.particles.vel
+        if self.speed_sq is None or self.speed_sq.shape[0] != vel.shape[0]:
+            self.speed_sq = np.empty(vel.shape[0], dtype=vel.dtype)
+        max_speed = float(np.sqrt(np.max(np.einsum("ij,ij->i", vel, vel, out=self.speed_sq), initial=0.0)))
+        # 陰解法では弾性波の条件はいらない
+        wave_speed = 0.0 if self.implicit_solver is not None else self.wave_speed
+        dt = timestep.cfl_dt(max_speed, self.dx, self.cfl, abs(self.gravity), wave_speed)
+        if self.dt_max is not None:
+            dt = min(dt, self.dt_max)
+        return dt
+
+    def substep(self, dt):
+        """ 時間幅 dt で1ステップ進める """
+        self.dt = dt
+        if self.sort_interval and self.step_count % self.sort_interval == 0:
+            self.sort_particles()
+        if self.workers and self.executor is None:
+            # 最初のステップでワーカーを起動する（区間が空間的にまとまるよう先に並べ替える）
+            self.sort_particles()
+            self.executor = parallel.ParallelExecutor(self, self.workers)
+        self._p2g()
+        self._grid_update()
+        self._implicit_solve()
+        self._boundary()
+        self._g2p()
+        self.step_count += 1
+        self.time += dt
+        if self.diagnostics is not None:
+            self.diagnostics.after_step(self)
+
+    def sort_particles(self):
+        """ 粒子をセルのMorton順に並べ替え、その順番を返す """
+        order = morton_order(self.particles.pos, self.dx)
+        self.particles.reorder(order)
+        self.last_order = order
+        return order
+
+    def close(self):
+        """ 並列実行用のワーカーを止め、以降は1プロセスで計算する """
+        if self.executor is not None:
+            self.executor.close()
+            self.executor = None
+        self.workers = None
+
+    def _p2g(self):
+        if self.fused_step is not None:
+            self.fused_step.p2g(self.particles, self.dt, self.grid_mass, self.grid_vel)
+            return
+        if self.executor is not None:
+            self.executor.p2g(self.dt)
+            return
+        p = self.particles
+        # 全粒子の周囲ノード・重み・勾配を一括で計算し、G2Pでも使い回す
+        self.weights.update(p.pos, self.dx, self.n_grid)
+        if self.sparse is not None:
+            # 粒子が触れるブロックだけを有効にし、ノード番号を詰めた配列の番号に付け替える
+            self.weights.node = self.sparse.activate(self.weights.node, self.weights.inside)
+            self.grid_mass, self.grid_vel = self.sparse.grid_mass, self.sparse.grid_vel
+        transfer.particle_to_grid(self.weights, p, self.material, self.dt, self.grid_mass, self.grid_vel)
+
+    def _grid_update(self):
+        if self.fused_step is not None:
+            self.fused_step.grid_update(self.dt, self.gravity, self.grid_mass, self.grid_vel)
+            return
+        grid_mass, grid_vel = self.grid_mass, self.grid_vel
+        # 運動量を質量で割り、速度に変換（where= で配列を書き換え、コピーを作らない）
+        # 質量が0のままの速度は0のまま
+        if self.mass_filter is None or self.mass_filter.shape != grid_mass.shape:
+            self.mass_filter = np.empty(grid_mass.shape, dtype=bool)
+        mass_filter = np.greater(grid_mass, 1e-10, out=self.mass_filter) # ごくわずかな質量も考慮
+        np.divide(grid_vel, grid_mass[..., np.newaxis], out=grid_vel, where=mass_filter[..., np.newaxis])
+
+        # 重力を加える（質量があるすべての点に）
+        np.add(grid_vel[..., 1], self.dt * self.gravity, out=grid_vel[..., 1], where=mass_filter)
+
+    def _implicit_solve(self):
+        if self.implicit_solver is None:
+            return
+        self.implicit_solver.solve(self.weights, self.particles, self.dt, self.grid_mass, self.grid_vel,
+                                   boundary=self._boundary)
+
+    def _boundary(self):
+        # 境界条件（4方の壁）。JITではグリッドの更新の中で済んでいる
+        if self.fused_step is not None:
+            return
+        if self.sparse is not None:
+            self._sparse_boundary()
+            return
+        grid_vel, b = self.grid_vel, self.boundary_nodes
+        # X方向の壁
+        left, right = grid_vel[:, :b, 0], grid_vel[:, -b:, 0]
+        left[left < 0] = 0    # 左壁
+        right[right > 0] = 0    # 右壁
+        # Y方向の壁
+        floor, ceiling = grid_vel[:b, :, 1], grid_vel[-b:, :, 1]
+        floor[floor < 0] = 0    # 床より下に行こうとしたら止める
+        ceiling[ceiling > 0] = 0    # 天井より上に行こうとしたらとめる
+
+    def _sparse_boundary(self):
+        # 有効ブロックのノードだけについて、全体での座標から壁かどうかを判定する
+        gy, gx = self.sparse.node_coords()
+        b, n = self.boundary_nodes, self.n_grid
+        walls = [
+            (gx < b, 0, -1),    # 左壁
+            (gx >= n - b, 0, 1),    # 右壁
+            (gy < b, 1, -1),    # 床
+            (gy >= n - b, 1, 1),    # 天井
+        ]
+        for wall, axis, direction in walls:
+            v = self.grid_vel[..., axis]
+            # 壁の外向きに進もうとしたら止める
+            v[wall & (v * direction > 0)] = 0
+
+    def dense_grid(self):
+        """ グリッドを密な (grid_mass, grid_vel) として返す """
+        if self.sparse is None:
+            return self.grid_mass, self.grid_vel
+        return self.sparse.to_dense()
+
+    def _g2p(self):
+        if self.fused_step is not None:
+            self.fused_step.g2p(self.particles, self.dt, self.grid_vel)
+            return
+        if self.executor is not None:
+            self.executor.g2p(self.dt)
+            return
+        transfer.grid_to_particle(self.weights, self.particles, self.material, self.dt, self.grid_vel)
+
+    # 状態の参照用
+    def positions(self):
+        return self.particles.pos
+
+    def velocities(self):
+        return self.particles.vel
+
+    def num_particles(self):
+        return len(self.particles)
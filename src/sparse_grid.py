@@ -0,0 +1,69 @@
+import numpy as np
+
+
+class SparseBlockGrid:
+    """ 粒子がいるブロック（block_size × block_size のタイル）だけを確保する疎なグリッド
+
+    毎ステップ activate() で粒子が触れるブロックを集め、グリッドの質量・速度は
+    (有効ブロック数, block_size, block_size) の詰めた配列に持つ。
+    ノード番号を詰めた配列の中の番号に付け替えるので、transfer の P2G / G2P は
+    密なグリッドと同じように使える。
+    """
+
+    def __init__(self, n_grid, block_size=8, dtype=np.float64):
+        self.n_grid = n_grid
+        self.block_size = block_size
+        self.dtype = np.dtype(dtype)
+        self.n_blocks_side = -(-n_grid // block_size)   # 切り上げ
+        n_blocks = self.n_blocks_side**2
+        # ブロック番号 -> 詰めた配列の中の位置（使われていないブロックは -1）
+        self.slot = np.full(n_blocks, -1, dtype=np.int64)
+        self.touched = np.zeros(n_blocks, dtype=bool)
+        self.active = np.zeros(0, dtype=np.int64)
+        self.grid_mass = np.zeros((0, block_size, block_size), dtype=self.dtype)
+        self.grid_vel = np.zeros((0, block_size, block_size, 2), dtype=self.dtype)
+        self._coords = None
+
+    def activate(self, node, inside):
+        """ 粒子が触れるブロックを有効にし、ノード番号 (N, K) を詰めた配列の番号に変換して返す """
+        b = self.block_size
+        node_y, node_x = np.divmod(node, self.n_grid)
+        block = (node_y // b) * self.n_blocks_side + node_x // b
+
+        # 前のステップの対応表を消してから、今回触れるブロックを集める
+        self.slot[self.active] = -1
+        self.touched[self.active] = False
+        self.touched[block[inside]] = True
+        self.active = np.flatnonzero(self.touched)
+        self.slot[self.active] = np.arange(len(self.active))
+
+        # P2Gで全体が上書きされるので、ブロック数が変わったときだけ確保し直す
+        n_active = len(self.active)
+        if self.grid_mass.shape[0] != n_active:
+            self.grid_mass = np.zeros((n_active, b, b), dtype=self.dtype)
+            self.grid_vel = np.zeros((n_active, b, b, 2), dtype=self.dtype)
+        self._coords = None
+
+        local = self.slot[block] * (b * b) + (node_y % b) * b + node_x % b
+        return np.where(inside, local, 0)
+
+    def node_coords(self):
+        """ 有効ブロック内の各ノードの全体での座標 (gy, gx)、形は (有効ブロック数, b, b) """
+        if self._coords is None:
+            b = self.block_size
+            block_y, block_x = np.divmod(self.active, self.n_blocks_side)
+            local_y, local_x = np.divmod(np.arange(b * b).reshape(b, b), b)
+            gy = block_y[:, np.newaxis, np.newaxis] * b + local_y
+            gx = block_x[:, np.newaxis, np.newaxis] * b + local_x
+            self._coords = (gy, gx)
+        return self._coords
+
+    def to_dense(self):
+        """ 確認用に密なグリッド (grid_mass, grid_vel) に展開する """
+        dense_mass = np.zeros((self.n_grid, self.n_grid), dtype=self.dtype)
+        dense_vel = np.zeros((self.n_grid, self.n_grid, 2), dtype=self.dtype)
+        gy, gx = self.node_coords()
+        valid = (gy < self.n_grid) & (gx < self.n_grid)
+        dense_mass[gy[valid], gx[valid]] = self.grid_mass[valid]
+        dense_vel[gy[valid], gx[valid]] = self.grid_vel[valid]
+        return dense_mass, dense_vel
@@ -0,0 +1,150 @@
+""" シーンファイルのパラメータを変えた組み合わせを、複数のプロセスでヘッドレスに実行する（パラメータスイープ）
+
+スイープファイルの例（scenes/sweep_elasticity.json）:
+    {
+      "scene": "elasticity.json",
+      "parameters": {"material.youngs_modulus": [1e5, 2e5], "bodies.0.velocity": [[0, 0], [1, 0]]},
+      "cases": [{"simulation.kernel": "cubic"}],
+      "run": {"sim_time": 0.5}
+    }
+
+parameters は値のすべての組み合わせ、cases は1つずつの上書き（点区切りの場所 -> 値）として実行する。
+scene はスイープファイルからの相対パスで、run を書けばシーンの run より優先する。
+出力先にはケースごとのディレクトリ（scene.json, result.json, --frames ならフレーム）と、
+終わった順に1行ずつ追記する results.jsonl ができる。
+
+使い方:
+    python src/sweep.py scenes/sweep_elasticity.json --output runs/elasticity --workers 4
+"""
+import argparse
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import headless
+import jit
+import scenefile
+from output import FrameWriter
+
+DEFAULT_STEPS = 1000
+RESULTS_NAME = "results.jsonl"
+
+
+def expand(sweep):
+    """ スイープの設定から上書きの辞書を並べる（parameters の全組み合わせのあとに cases） """
+    parameters = sweep.get("parameters", {})
+    keys = list(parameters)
+    cases = []
+    if keys:
+        for values in itertools.product(*(parameters[k] for k in keys)):
+            cases.append(dict(zip(keys, values)))
+    cases.extend(dict(case) for case in sweep.get("cases", []))
+    return cases or [{}]
+
+
+def load(path):
+    """ スイープファイルを読み、(元のシーン, 上書きのリスト) を返す """
+    sweep = scenefile.load(path)
+    scene = sweep["scene"]
+    if isinstance(scene, str):
+        scene = scenefile.load(os.path.join(os.path.dirname(os.path.abspath(path)), scene))
+    if "run" in sweep:
+        scene = dict(scene, run=sweep["run"])
+    return scene, expand(sweep)
+
+
+def init_worker():
+    # 各プロセスが1ケースずつ計算するので、Numba のスレッドは1本にしてCPUを取り合わないようにする
+    if jit.AVAILABLE:
+        jit.numba.set_num_threads(1)
+
+
+def run_case(name, scene, overrides, case_dir, frames=False, frame_time=1.0 / 60.0):
+    """ 1つのケースを実行して結果の辞書を返す（ケースのディレクトリにも書く） """
+    scene = scenefile.with_overrides(scene, overrides)
+    os.makedirs(case_dir, exist_ok=True)
+    with open(os.path.join(case_dir, "scene.json"), "w") as f:
+        json.dump(scene, f, indent=2)
+
+    result = {"case": name, "overrides": overrides}
+    writer = None
+    try:
+        sim = scenefile.build(scene)
+        if frames:
+            writer = FrameWriter(os.path.join(case_dir, "frames"))
+        settings = scene.get("run", {})
+        if "sim_time" in settings:
+            elapsed, steps = headless.run_for(sim, settings["sim_time"], writer, frame_time)
+        else:
+            steps = settings.get("steps", DEFAULT_STEPS)
+            elapsed = headless.run(sim, steps, writer)
+        pos = np.asarray(sim.positions(), dtype=float).reshape(-1, 2)
+        vel = np.asarray(sim.velocities(), dtype=float).reshape(-1, 2)
+        n = sim.num_particles()
+        finite = bool(np.isfinite(pos).all() and np.isfinite(vel).all())
+        speed = np.sqrt(np.einsum("ij,ij->i", vel, vel)) if finite and n else np.zeros(1)
+        result.update({
+            "status": "ok" if finite else "unstable",
+            "n_particles": n, "steps": steps, "sim_time": float(sim.time), "elapsed": elapsed,
+            "steps_per_sec": steps / elapsed if elapsed > 0 else None,
+            "particle_steps_per_sec": steps * n / elapsed if elapsed > 0 else None,
+            "center": pos.mean(axis=0).tolist() if finite and n else None,
+            "mean_speed": float(speed.mean()), "max_speed": float(speed.max()),
+        })
+        if hasattr(sim, "close"):
+            sim.close()
+    except Exception as e:
+        result.update({"status": "error", "error": f"{type(e).__name__}: {e}"})
+    finally:
+        if writer is not None:
+            writer.close()
+
+    with open(os.path.join(case_dir, "result.json"), "w") as f:
+        json.dump(result, f, indent=2)
+    return result
+
+
+def sweep(path, output, workers=1, frames=False, frame_time=1.0 / 60.0):
+    """ スイープファイル path の全ケースを workers プロセスで実行し、結果のリストを返す """
+    scene, cases = load(path)
+    os.makedirs(output, exist_ok=True)
+    jobs = [(f"case_{i:04d}", scene, overrides) for i, overrides in enumerate(cases)]
+    results = []
+    with open(os.path.join(output, RESULTS_NAME), "w") as log, \
+            ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        futures = [pool.submit(run_case, name, scene, overrides, os.path.join(output, name), frames, frame_time)
+                   for name, scene, overrides in jobs]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            log.write(json.dumps(result) + "\n")
+            log.flush()
+            rate = result.get("steps_per_sec")
+            print(f"[{len(results)}/{len(jobs)}] {result['case']} {result['status']:<8}"
+                  f" {'' if rate is None else f'{rate:.1f} steps/s'}  {result['overrides']}")
+    results.sort(key=lambda r: r["case"])
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="シーンのパラメータを変えながら並列に実行する")
+    parser.add_argument("sweep", help="スイープファイル (.json)")
+    parser.add_argument("--output", default="sweep_output", help="結果を書き出すディレクトリ")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="同時に実行するプロセス数")
+    parser.add_argument("--frames", action="store_true", help="ケースごとにフレームも書き出す")
+    parser.add_argument("--frame-time", type=float, default=1.0 / 60.0,
+                        help="sim_time で実行するとき、このシミュレーション時間ごとにフレームを書き出す")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    results = sweep(args.sweep, args.output, args.workers, args.frames, args.frame_time)
+    failed = sum(r["status"] != "ok" for r in results)
+    print(f"{len(results)} cases ({failed} not ok) in {time.perf_counter() - start:.1f} s -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+import math
+
+
+def cfl_dt(max_speed, length, cfl, acceleration=0.0, wave_speed=0.0):
+    """ 1ステップで粒子も弾性波も cfl * length 以上進まない最大の dt を返す
+
+    速度の条件は加速度による増分も含めて (v + a dt) dt <= cfl * length を解く。
+    """
+    limit = cfl * length
+    if acceleration > 0.0:
+        dt = (-max_speed + math.sqrt(max_speed**2 + 4.0 * acceleration * limit)) / (2.0 * acceleration)
+    elif max_speed > 0.0:
+        dt = limit / max_speed
+    else:
+        dt = math.inf
+    if wave_speed > 0.0:
+        dt = min(dt, limit / (wave_speed + max_speed))
+    return dt
+
+
+def advance(sim, duration):
+    """ sim を duration だけ進める（サブステップのスケジューラ）
+
+    各サブステップで sim.stable_dt() を問い合わせ、最後の1回は端数に合わせて縮める。
+    実行したサブステップ数を返す。
+    """
+    end = sim.time + duration
+    substeps = 0
+    while end - sim.time > 1e-12 * max(1.0, abs(end)):
+        sim.substep(min(sim.stable_dt(), end - sim.time))
+        substeps += 1
+    return substeps
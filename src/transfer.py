@@ -0,0 +1,205 @@
+import numpy as np
+
+
+# 1次元の補間カーネル N(t) とその微分 N'(t)（t = 粒子位置 - ノード位置、格子間隔で正規化）
+def linear_kernel(t):
+    a = np.abs(t)
+    return np.where(a < 1.0, 1.0 - a, 0.0), np.where(a < 1.0, -np.sign(t), 0.0)
+
+
+def quadratic_kernel(t):
+    a = np.abs(t)
+    w = np.where(a < 0.5, 0.75 - a**2, np.where(a < 1.5, 0.5 * (1.5 - a)**2, 0.0))
+    dw = np.where(a < 0.5, -2.0 * t, np.where(a < 1.5, -(1.5 - a) * np.sign(t), 0.0))
+    return w, dw
+
+
+def cubic_kernel(t):
+    a = np.abs(t)
+    w = np.where(a < 1.0, 0.5 * a**3 - a**2 + 2.0 / 3.0, np.where(a < 2.0, (2.0 - a)**3 / 6.0, 0.0))
+    dw = np.where(a < 1.0, 1.5 * t * a - 2.0 * t, np.where(a < 2.0, -0.5 * (2.0 - a)**2 * np.sign(t), 0.0))
+    return w, dw
+
+
+# カーネル名 -> (関数, 1軸あたりのノード数, 左端ノードのずらし量, MLSのD⁻¹の係数 (D⁻¹ = 係数 / dx²))
+# 線形カーネルは D が一定にならないので、アフィン項には重みの勾配をそのまま使う
+KERNELS = {
+    "linear": (linear_kernel, 2, 0.0, None),
+    "quadratic": (quadratic_kernel, 3, 0.5, 4.0),
+    "cubic": (cubic_kernel, 4, 1.0, 3.0),
+}
+
+
+class TransferWeights:
+    """ 1ステップ分の補間ノード・重み・重みの勾配をまとめて保持するキャッシュ
+
+    update() を各ステップのP2Gの前に1度だけ呼び、P2GとG2Pの両方で同じ値を使う。
+    node, weights は (N, K)、dpos（ノード位置 - 粒子位置）と grad は (N, K, 2)。
+    範囲外のノードは重み0・番号0として扱い、inside (N, K) で範囲内かどうかを持つ。
+    (N, K, ...) の配列は buffer() で確保したものを毎ステップ上書きして使い回す
+    （型は粒子の位置の型に合わせる）。
+    """
+
+    def __init__(self, kernel="linear"):
+        if kernel not in KERNELS:
+            raise ValueError(f"unknown kernel: {kernel} (choose from {', '.join(KERNELS)})")
+        self.kernel = kernel
+        self.kernel_func, self.support, self.shift, self.d_inv_coef = KERNELS[kernel]
+        # 周囲ノードの並びは i * support + j（i: Y方向, j: X方向のオフセット）
+        self.d_inv = None
+        self.buffers = {}
+
+    def buffer(self, name, shape, dtype):
+        """ 名前ごとの作業用の配列（形か型が変わったときだけ確保し直す） """
+        a = self.buffers.get(name)
+        if a is None or a.shape != shape or a.dtype != dtype:
+            a = self.buffers[name] = np.empty(shape, dtype=dtype)
+        return a
+
+    def update(self, pos, dx, n_grid):
+        n, s = pos.shape[0], self.support
+        dtype = pos.dtype
+        # 粒子の座標から、左下のノードとそこからの相対距離を計算
+        grid_pos = pos / dx
+        # 整数に変換する前の値で引き算して、fx を粒子と同じ型（float32 など）のまま保つ
+        base = np.floor(grid_pos - self.shift)
+        fx = grid_pos - base
+        base_node = base.astype(np.int64)
+
+        # 各軸の1次元の重みと微分 (N, support, 2)
+        t = fx[:, np.newaxis, :] - np.arange(self.support, dtype=dtype)[np.newaxis, :, np.newaxis]
+        w1d, dw1d = self.kernel_func(t)
+        # 2次元の値は (N, support(Y), support(X)) の形で見た作業用の配列へ、
+        # 各軸の値の積をブロードキャストで直接書き込む（(N, K) の一時配列を作らない）
+        wx, wy = w1d[:, np.newaxis, :, 0], w1d[:, :, np.newaxis, 1]
+
+        self.dpos = self.buffer("dpos", (n, s * s, 2), dtype)
+        dpos = self.dpos.reshape(n, s, s, 2)
+        offset = np.arange(s, dtype=dtype)
+        np.copyto(dpos[..., 0], (offset - fx[:, 0, np.newaxis])[:, np.newaxis, :])
+        np.copyto(dpos[..., 1], (offset - fx[:, 1, np.newaxis])[:, :, np.newaxis])
+        self.dpos *= dx
+
+        node_1d = base_node[:, np.newaxis, :] + np.arange(s)[np.newaxis, :, np.newaxis]  # (N, support, 2)
+        # グリッドインデックスが範囲内かチェック
+        inside_1d = (0 <= node_1d) & (node_1d < n_grid)
+        self.inside = self.buffer("inside", (n, s * s), np.bool_)
+        np.logical_and(inside_1d[:, :, np.newaxis, 1], inside_1d[:, np.newaxis, :, 0],
+                       out=self.inside.reshape(n, s, s))
+        self.node = self.buffer("node", (n, s * s), np.int64)
+        np.add((node_1d[:, :, 1] * n_grid)[:, :, np.newaxis], node_1d[:, np.newaxis, :, 0],
+               out=self.node.reshape(n, s, s))
+        self.node *= self.inside
+        self.weights = self.buffer("weights", (n, s * s), dtype)
+        np.multiply(wx, wy, out=self.weights.reshape(n, s, s))
+        self.weights *= self.inside
+
+        self.grad = self.buffer("grad", (n, s * s, 2), dtype)
+        if self.d_inv_coef is None:
+            grad = self.grad.reshape(n, s, s, 2)
+            np.multiply(dw1d[:, np.newaxis, :, 0], wy, out=grad[..., 0])
+            np.multiply(wx, dw1d[:, :, np.newaxis, 1], out=grad[..., 1])
+            self.grad *= self.inside[:, :, np.newaxis]
+            self.grad /= dx
+        else:
+            # MLS-MPM: 重みの勾配を w D⁻¹ (x_i - x_p) で近似する
+            self.d_inv = self.d_inv_coef / dx**2
+            scaled = self.buffer("scaled_weights", (n, s * s), dtype)
+            np.multiply(self.weights, self.d_inv, out=scaled)
+            np.multiply(scaled[:, :, np.newaxis], self.dpos, out=self.grad)
+        return self
+
+
+# P2Gで1回のbincountにまとめるチャンネル（0: 質量, 1: X運動量, 2: Y運動量）
+CHANNELS = np.arange(3)
+
+
+def p2g(cache, mass, vel, grid_mass, grid_vel, affine=None, force=None):
+    """ 粒子の質量と運動量をグリッドへ散布する（1回のbincountで集約）
+
+    affine (N, 2, 2) はAPICのアフィン運動量 m C で、各ノードへ w affine @ dpos を加える。
+    force (N, 2, 2) は応力項 -dt V₀ P Fᵀ で、各ノードへ force @ ∇w を加える。
+    途中の (N, K, ...) の値は cache の作業用の配列に書く（bincount の結果だけは新しく確保される）。
+    """
+    n_nodes = grid_mass.size
+    n, k = cache.weights.shape
+    dtype = cache.weights.dtype
+    # チャンネル 0: 質量, 1: X運動量, 2: Y運動量 をまとめた配列に直接書き込む
+    values = cache.buffer("values", (n, k, 3), dtype)
+    weighted_mass, momentum = values[..., 0], values[..., 1:]
+    np.multiply(cache.weights, mass[:, np.newaxis], out=weighted_mass)
+    np.multiply(weighted_mass[:, :, np.newaxis], vel[:, np.newaxis, :], out=momentum)
+    if cache.d_inv is not None and force is not None:
+        # MLSでは ∇w = w D⁻¹ dpos なので、応力項もアフィン項にまとめて1回で計算できる
+        combined = cache.buffer("combined", force.shape, dtype)
+        np.multiply(force, cache.d_inv, out=combined)
+        if affine is not None:
+            combined += affine
+        affine, force = combined, None
+    term = cache.buffer("term", (n, k, 2), dtype)
+    if affine is not None:
+        np.einsum("nij,nkj->nki", affine, cache.dpos, out=term)
+        term *= cache.weights[:, :, np.newaxis]
+        momentum += term
+    if force is not None:
+        np.einsum("nij,nkj->nki", force, cache.grad, out=term)
+        momentum += term
+    index = cache.buffer("index", (n, k, 3), np.int64)
+    np.multiply(cache.node[:, :, np.newaxis], 3, out=index)
+    index += CHANNELS
+    summed = np.bincount(index.ravel(), weights=values.ravel(), minlength=n_nodes * 3)
+    summed = summed.reshape(grid_mass.shape + (3,))
+    grid_mass[:] = summed[..., 0]
+    grid_vel[:] = summed[..., 1:]
+
+
+def gather(cache, grid_vel, name="node_vel"):
+    """ 各粒子の周囲ノードの速度 (N, K, 2)（cache の作業用の配列 name に書く） """
+    node_vel = cache.buffer(name, cache.node.shape + (2,), grid_vel.dtype)
+    # 番号はすべて範囲内なので、mode="clip" にして内部でのコピーを避ける
+    return np.take(grid_vel.reshape(-1, 2), cache.node, axis=0, out=node_vel, mode="clip")
+
+
+def particle_to_grid(cache, particles, material, dt, grid_mass, grid_vel):
+    """ 1ステップ分のP2G（重みは cache.update() 済みのものを使う）
+
+    material が None なら質量と運動量だけを散布するPIC、
+    そうでなければMLS-MPMとして応力による力とアフィン運動量も一緒に散布する。
+    """
+    p = particles
+    if material is None:
+        # 質量と運動量をまとめて散布
+        p2g(cache, p.mass, p.vel, grid_mass, grid_vel)
+        return
+
+    # MLS-MPM: 応力による力 -dt V₀ P Fᵀ ∇w をアフィン運動量 m C と一緒に
+    # 運動量の散布の中で送る（力だけを別に計算するパスが不要になる）
+    stress = material.first_piola(p.F)
+    force = cache.buffer("force", p.F.shape, p.F.dtype)
+    np.matmul(stress, p.F.transpose(0, 2, 1), out=force)
+    scale = cache.buffer("scale", p.volume.shape, p.volume.dtype)
+    np.multiply(p.volume, -dt, out=scale)
+    force *= scale[:, np.newaxis, np.newaxis]
+    affine = cache.buffer("affine", p.C.shape, p.C.dtype)
+    np.multiply(p.mass[:, np.newaxis, np.newaxis], p.C, out=affine)
+    p2g(cache, p.mass, p.vel, grid_mass, grid_vel, affine=affine, force=force)
+
+
+def grid_to_particle(cache, particles, material, dt, grid_vel):
+    """ 1ステップ分のG2P（速度・アフィン行列・変形勾配・位置を粒子の配列に直接書き込む） """
+    p = particles
+    node_vel = gather(cache, grid_vel)
+    # グリッドから補間して新しい速度を計算
+    np.einsum("nk,nkc->nc", cache.weights, node_vel, out=p.vel)
+    if material is not None:
+        # アフィン行列を集め、変形勾配を F ← (I + dt C) F で更新
+        np.einsum("nki,nkj->nij", node_vel, cache.grad, out=p.C)
+        update = cache.buffer("deformation", p.F.shape, p.F.dtype)
+        np.multiply(p.C, dt, out=update)
+        update += np.eye(2, dtype=p.F.dtype)
+        new_F = cache.buffer("new_F", p.F.shape, p.F.dtype)
+        np.matmul(update, p.F, out=new_F)
+        p.F[:] = new_F
+    displacement = cache.buffer("displacement", p.pos.shape, p.pos.dtype)
+    np.multiply(p.vel, dt, out=displacement)
+    p.pos += displacement
@@ -0,0 +1,358 @@
+import tkinter as tk
+import time
+
+import numpy as np
+
+from physics_thread import PhysicsThread, StateBuffer
+from render import ItemTracker, RasterRenderer
+
+
+# 描画用のグリッドクラス
+class GridPoints:
+    def __init__(self, x, y, radius, color, canvas, win_x, win_y):
+        self.pos = [x, y]
+        self.radius = radius
+        self.color = color
+        self.canvas = canvas
+        self.win_x, self.win_y = win_x, win_y
+        self.id = None
+
+    def draw(self):
+        x = self.pos[0] * self.win_x
+        y = (1.0 - self.pos[1]) * self.win_y
+
+        x0 = x - self.radius
+        y0 = y - self.radius
+        x1 = x + self.radius
+        y1 = y + self.radius
+
+        if self.id is None:
+            self.id = self.canvas.create_oval(x0, y0, x1, y1, fill=self.color, outline="")
+        else:
+            self.canvas.coords(self.id, x0, y0, x1, y1)
+
+
+class Viewer:
+    """ シミュレーションの状態を一定のフレームレートで描画するtkinterビューア
+
+    物理計算は 1フレームの時間予算を使い切るまで sim.step() を繰り返し、
+    その後に最新の状態を1回だけ描画する。
+    sim_time_per_frame を渡すと、代わりに毎フレームその分のシミュレーション時間だけ
+    sim.advance() で進める（サブステップ数はシミュレーション側が決める）。
+    threaded=True（既定）では物理計算を別スレッド（physics_thread.PhysicsThread）で回し、
+    ビューアは target_fps ごとに最新の完成した状態を描く。描画が遅くても、ウィンドウを
+    動かしている間も物理計算は止まらない。False なら1つのループで交互に計算と描画をする。
+    物理スレッドは全速力で回る。pace_physics=True なら1フレームが 1/target_fps 秒より
+    早く終わったときに残りを待つ（sim_time_per_frame と合わせてシミュレーションを実時間に合わせる）。
+    render_mode="raster" では全粒子を1枚の画像にして貼り付け、
+    render_mode="items" では従来通り粒子ごとに create_oval の図形を動かす。このとき位置をピクセルに丸めて
+    前のフレームから動いた図形だけを1回のTclスクリプトでまとめて動かし、中心が同じ item_cull_px 四方に入って
+    重なっている粒子は1つを残して隠す（省略時は粒子の半径、0 なら隠さない）。
+    output に FrameWriter を渡すと、毎フレームの状態を書き出す（ウィンドウを閉じると書き切る）。
+    history に history.FrameHistory を渡すと直近のフレームを残し、計算し直さずに見返せる:
+    スペースで一時停止・再開、←/→（Shift で10フレーム）で1フレームずつ移動、Home/End で最古/最新、
+    "r" で残っている最古のフレームから再生する。再開すると一時停止した時点の続きから計算する。
+    timers に instrument.PhaseTimers を渡すと、フェーズごとの時間（平均・p95）を左上に表示する
+    （"t" キーで計測のオン・オフを切り替える）。
+    """
+
+    # 計測するビューア側のフェーズ名 -> メソッド名
+    PHASES = {"physics": "advance_frame", "draw": "draw"}
+
+    def __init__(self, sim, title, win_x=800, win_y=800, particle_radius_px=5,
+                 colors="#06D6A0", n_grid_side=None, grid_point_radius_px=1,
+                 target_fps=60, steps_per_batch=1, render_mode="raster", sim_time_per_frame=None,
+                 output=None, timers=None, item_cull_px=None, threaded=True, history=None,
+                 pace_physics=False):
+        self.sim = sim
+        self.title = title
+        self.win_x, self.win_y = win_x, win_y
+        self.particle_radius_px = particle_radius_px
+        self.colors = colors
+        self.frame_budget = 1.0 / target_fps
+        self.steps_per_batch = steps_per_batch
+        self.sim_time_per_frame = sim_time_per_frame
+        self.render_mode = render_mode
+        self.output = output
+        self.timers = timers
+        self.threaded = threaded
+        self.pace_physics = pace_physics
+        self.state = StateBuffer()
+        self.physics = None
+        self.drawn_version = None
+        # 一時停止中は history の cursor 番目のフレームを描く（replaying なら1フレームずつ進める）
+        self.history = history
+        self.outputs = [o for o in (output, history) if o is not None]
+        self.paused = False
+        self.replaying = False
+        self.cursor = 0
+        self.drawn_cursor = None
+
+        # GUIセットアップ
+        self.window = tk.Tk()
+        self.window.title(title)
+        self.window.geometry(f"{win_x}x{win_y}")
+        self.window.resizable(False, False)
+
+        # キャンバスの作成
+        self.canvas = tk.Canvas(self.window, width=win_x, height=win_y, bg="#4D4D4D", highlightthickness=0)
+        self.canvas.pack()
+
+        self.particle_ids = []  # 粒子描画用のキャンバスID
+        self.item_tracker = ItemTracker(win_x, win_y,
+                                        particle_radius_px if item_cull_px is None else item_cull_px)
+        self.item_commands = 0  # 直前のフレームで図形を書き換えた回数
+        self.grid_points = []
+        if render_mode == "raster":
+            self.raster_init(n_grid_side, grid_point_radius_px)
+        elif n_grid_side is not None:
+            self.grid_points_init(n_grid_side, grid_point_radius_px)
+
+        # FPS計算用の変数
+        self.last_time, self.frame_count, self.fps = 0, 0, 0
+        self.sum_fps, self.update_count, self.average_fps = 0, 0, 0.0
+        self.last_step_count = sim.step_count
+
+        # フェーズごとの時間の表示
+        self.stats_id = None
+        if timers is not None:
+            self.stats_id = self.canvas.create_text(8, 8, anchor="nw", fill="#FFFFFF", font=("Courier", 10))
+            self.toggle_timers()
+            self.window.bind("<Key-t>", lambda event: self.toggle_timers())
+
+        # 巻き戻し・再生の操作と状態の表示
+        self.history_id = None
+        if history is not None:
+            self.history_id = self.canvas.create_text(win_x - 8, 8, anchor="ne", fill="#FFFFFF",
+                                                      font=("Courier", 10))
+            bindings = {
+                "<space>": self.toggle_pause, "<Key-r>": self.replay,
+                "<Left>": lambda: self.scrub(-1), "<Right>": lambda: self.scrub(1),
+                "<Shift-Left>": lambda: self.scrub(-10), "<Shift-Right>": lambda: self.scrub(10),
+                "<Home>": lambda: self.scrub(-len(self.history)), "<End>": lambda: self.scrub(len(self.history)),
+            }
+            for key, action in bindings.items():
+                self.window.bind(key, lambda event, action=action: action())
+
+    def toggle_timers(self):
+        """ フェーズごとの計測のオン・オフを切り替える（オフのときは計測のコストがかからない） """
+        if self.timers.enabled:
+            self.timers.detach()
+            self.canvas.itemconfigure(self.stats_id, text="")
+        else:
+            self.timers.reset()
+            self.timers.attach(self.sim, self.sim.PHASES)
+            self.timers.attach(self, self.PHASES)
+
+    def update_stats(self):
+        if self.stats_id is None or not self.timers.enabled:
+            return
+        text = self.timers.summary()
+        if self.render_mode == "items":
+            text += f"\nitems   {self.item_commands:7d} / {len(self.particle_ids)}"
+        self.canvas.itemconfigure(self.stats_id, text=text)
+        # 粒子の図形より手前に出す
+        self.canvas.tag_raise(self.stats_id)
+
+    def pause(self):
+        """ 物理計算を止め、最新のフレームから見返せるようにする """
+        if self.paused:
+            return
+        if self.physics is not None:
+            # フレームの切れ目で止まるまで待つので、そのあとは history を書き換えられない
+            self.physics.pause()
+        self.paused = True
+        self.cursor = len(self.history) - 1
+
+    def resume(self):
+        self.paused = False
+        self.replaying = False
+        self.drawn_cursor = None
+        self.drawn_version = None
+        self.canvas.itemconfigure(self.history_id, text="")
+        if self.physics is not None:
+            self.physics.resume()
+
+    def toggle_pause(self):
+        if self.paused:
+            self.resume()
+        else:
+            self.pause()
+
+    def scrub(self, delta):
+        """ 一時停止して delta フレームだけ前後に移動する """
+        self.pause()
+        self.replaying = False
+        self.cursor = min(max(self.cursor + delta, 0), len(self.history) - 1)
+
+    def replay(self):
+        """ 一時停止して残っている最古のフレームから再生する """
+        self.pause()
+        self.replaying = True
+        self.cursor = 0
+
+    def draw_history(self):
+        """ 一時停止中に cursor のフレームを描く（変わったときだけ） """
+        if not len(self.history):
+            return
+        if self.replaying:
+            if self.drawn_cursor == self.cursor and self.cursor < len(self.history) - 1:
+                self.cursor += 1
+            elif self.cursor == len(self.history) - 1:
+                self.replaying = False
+        if self.cursor == self.drawn_cursor:
+            return
+        self.drawn_cursor = self.cursor
+        info, arrays = self.history.frame(self.cursor)
+        self.draw(arrays["pos"])
+        mode = "replay" if self.replaying else "paused"
+        self.canvas.itemconfigure(self.history_id, text=f"{mode}  {self.cursor + 1:4d} / {len(self.history)}"
+                                                        f"  step {info['step']}  t={info['time']:.3f}")
+        self.canvas.tag_raise(self.history_id)
+
+    def grid_points_init(self, n_grid_side, radius):
+        dx = 1.0 / n_grid_side
+        for i in range(n_grid_side):
+            for j in range(n_grid_side):
+                # グリッド点はセルの中心にある
+                x = (j + 0.5) * dx
+                y = (i + 0.5) * dx
+                g = GridPoints(x, y, radius, "#FFFFFF", self.canvas, self.win_x, self.win_y)
+                # 格子点は動かないので最初に1度だけ描く
+                g.draw()
+                self.grid_points.append(g)
+
+    def raster_init(self, n_grid_side, grid_point_radius):
+        self.renderer = RasterRenderer(self.win_x, self.win_y, particle_radius_px=self.particle_radius_px,
+                                       colors=self.colors)
+        if n_grid_side is not None:
+            # 格子点は動かないので背景レイヤーに1度だけ描いておく
+            centers = (np.indices((n_grid_side, n_grid_side))[::-1].reshape(2, -1).T + 0.5) / n_grid_side
+            self.renderer.add_static_points(centers, grid_point_radius, "#FFFFFF")
+        # 毎フレーム中身だけを差し替える画像を1つだけキャンバスに置く
+        self.photo = tk.PhotoImage(width=self.win_x, height=self.win_y)
+        self.image_id = self.canvas.create_image(0, 0, image=self.photo, anchor="nw")
+
+    def particle_color(self, k):
+        if isinstance(self.colors, str):
+            return self.colors
+        return self.colors[k]
+
+    def draw(self, pos):
+        if self.render_mode == "raster":
+            self.draw_raster(pos)
+        else:
+            self.draw_items(pos)
+
+    def draw_raster(self, pos):
+        self.photo.configure(data=self.renderer.render(pos), format="PPM")
+
+    def draw_items(self, pos):
+        # 正規化座標 -> ピクセル（全粒子まとめて変換し、前のフレームと比べる）
+        move, show, hide, px, py = self.item_tracker.update(pos)
+        r = self.particle_radius_px
+        ids = self.particle_ids
+        canvas = str(self.canvas)
+
+        # もし初回描写なら図形を生成、そうでなければ動いた図形だけ移動
+        commands = []
+        if not ids:
+            for k, (x, y) in enumerate(zip(px.tolist(), py.tolist())):
+                ids.append(self.canvas.create_oval(x - r, y - r, x + r, y + r, fill=self.particle_color(k),
+                                                   outline=""))
+        else:
+            commands = [f"{canvas} coords {ids[k]} {x - r} {y - r} {x + r} {y + r}"
+                        for k, x, y in zip(move.tolist(), px[move].tolist(), py[move].tolist())]
+        commands += [f"{canvas} itemconfigure {ids[k]} -state normal" for k in show.tolist()]
+        commands += [f"{canvas} itemconfigure {ids[k]} -state hidden" for k in hide.tolist()]
+        # Tkの呼び出しは1回にまとめる
+        if commands:
+            self.canvas.tk.eval("\n".join(commands))
+        self.item_commands = len(commands)
+
+    def update_fps(self, step_count):
+        # FPS計算ロジック
+        current_time = time.time()
+        self.frame_count += 1
+        # 1秒以上経過したらFPSを計算して表示を更新
+        if current_time - self.last_time > 1.0:
+            elapsed = current_time - self.last_time
+            self.fps = self.frame_count / elapsed
+            steps_per_sec = (step_count - self.last_step_count) / elapsed
+            self.sum_fps += self.fps
+            self.update_count += 1
+            self.average_fps = self.sum_fps / self.update_count
+            self.window.title(f"{self.title} - FPS: {self.fps:.1f} - Ave-FPS: {self.average_fps:.1f}"
+                              f" - steps/s: {steps_per_sec:.0f}")
+            self.frame_count = 0
+            self.last_time = current_time
+            self.last_step_count = step_count
+            self.update_stats()
+
+    def advance_frame(self, frame_start):
+        """ 1フレーム分の物理計算 """
+        if self.sim_time_per_frame is not None:
+            # 物理計算: 1フレーム分のシミュレーション時間だけ進める
+            self.sim.advance(self.sim_time_per_frame)
+        else:
+            # 物理計算: フレームの時間予算を使い切るまで進める（最低1回）
+            while True:
+                self.sim.step(self.steps_per_batch)
+                if time.perf_counter() - frame_start >= self.frame_budget:
+                    break
+
+    def main_loop(self):
+        if self.paused:
+            self.draw_history()
+            self.window.after(int(self.frame_budget * 1000), self.main_loop)
+            return
+        frame_start = time.perf_counter()
+        self.update_fps(self.sim.step_count)
+
+        self.advance_frame(frame_start)
+        for output in self.outputs:
+            output.write(self.sim)
+
+        # 描画
+        self.draw(self.sim.positions())
+
+        # 1msごとにこの関数を呼び出し、可能な限り高速にループさせる
+        self.window.after(1, self.main_loop)
+
+    def render_loop(self):
+        """ 物理スレッドが公開した最新の状態を、新しくなっていれば描く（threaded のとき） """
+        frame_start = time.perf_counter()
+        if self.physics.error is not None:
+            # 物理計算が失敗したらウィンドウを閉じて run() で例外を出す
+            self.window.destroy()
+            return
+        state = self.state.acquire()
+        if self.paused:
+            self.draw_history()
+        elif state["version"] != self.drawn_version:
+            self.drawn_version = state["version"]
+            self.update_fps(state["step_count"])
+            self.draw(state["pos"])
+        # 次のフレームの時刻まで待つ
+        delay = self.frame_budget - (time.perf_counter() - frame_start)
+        self.window.after(max(int(delay * 1000), 1), self.render_loop)
+
+    def run(self):
+        # メインループを開始し、ウィンドウイベントループへ
+        if self.threaded:
+            # advance_frame は "t" で計測を付け外しすると差し替わるので、毎フレーム引き直す
+            self.physics = PhysicsThread(self.sim, lambda frame_start: self.advance_frame(frame_start), self.state,
+                                         self.frame_budget if self.pace_physics else 0.0, self.outputs)
+            self.physics.start()
+            self.render_loop()
+        else:
+            self.main_loop()
+        try:
+            self.window.mainloop()
+        finally:
+            try:
+                if self.physics is not None:
+                    self.physics.stop()
+            finally:
+                if self.output is not None:
+                    self.output.close()
@@ -0,0 +1,33 @@
+import random
+
+import numpy as np
+import pytest
+
+import checkpoint
+import elasticity_neo_hookean
+import main
+
+
+@pytest.mark.parametrize("make", [lambda: elasticity_neo_hookean.create_simulation(backend="numpy"),
+                                  lambda: elasticity_neo_hookean.create_simulation(sparse_block_size=8),
+                                  lambda: main.create_simulation()])
+def test_restore_continues_identically(tmp_path, make):
+    random.seed(0)
+    sim = make()
+    sim.step(50)
+    checkpoint.save(sim, tmp_path / "ckpt")
+    sim.step(50)
+    restored = checkpoint.load(tmp_path / "ckpt")
+    restored.step(50)
+    assert restored.step_count == sim.step_count
+    assert restored.time == sim.time
+    np.testing.assert_array_equal(restored.positions(), sim.positions())
+    np.testing.assert_array_equal(restored.velocities(), sim.velocities())
+
+
+def test_save_refuses_other_directories(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "keep.txt").write_text("x")
+    with pytest.raises(ValueError):
+        checkpoint.save(main.create_simulation(), tmp_path / "data")
+    assert (tmp_path / "data" / "keep.txt").exists()
@@ -0,0 +1,23 @@
+import random
+
+import numpy as np
+import pytest
+
+import main
+
+
+def run(collision_method, steps=2000):
+    random.seed(1)
+    # 粒子を大きくして接触を増やし、固定 dt で比べる
+    sim = main.create_simulation(60, collision_method=collision_method, cfl=None)
+    sim.particles.radius[:] = 0.04
+    sim.step(steps)
+    return sim
+
+
+@pytest.mark.parametrize("collision_method", ["verlet", "spatial_hash"])
+def test_neighbor_search_matches_brute_force(collision_method):
+    expected = run("brute_force")
+    sim = run(collision_method)
+    np.testing.assert_allclose(sim.positions(), expected.positions(), atol=1e-10)
+    np.testing.assert_allclose(sim.velocities(), expected.velocities(), atol=1e-8)
@@ -0,0 +1,24 @@
+import numpy as np
+
+import only_gravity
+from output import FrameWriter, read_frames
+
+
+def write_frames(path, sort_interval, frames=6, steps=5):
+    sim = only_gravity.create_simulation(2000, backend="numpy", sort_interval=sort_interval)
+    with FrameWriter(path, dtype="float64", chunk_frames=4) as writer:
+        for _ in range(frames):
+            sim.step(steps)
+            writer.write(sim)
+    return [arrays for _, arrays in read_frames(path)]
+
+
+def test_frames_keep_particle_order_across_sorts(tmp_path):
+    """ 並べ替えをまたいでも、各フレームの行 k は同じ粒子になる """
+    sorted_frames = write_frames(tmp_path / "sorted", sort_interval=3)
+    unsorted_frames = write_frames(tmp_path / "unsorted", sort_interval=None)
+    assert len(sorted_frames) == len(unsorted_frames) == 6
+    for a, b in zip(sorted_frames, unsorted_frames):
+        # 並べ替えで変わるのはP2Gの足し合わせの順番だけ
+        np.testing.assert_allclose(a["pos"], b["pos"], atol=1e-9)
+        np.testing.assert_allclose(a["vel"], b["vel"], atol=1e-9)
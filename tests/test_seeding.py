@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+import seeding
+
+SHAPES = [
+    {"shape": "disc", "center": [0.5, 0.5], "radius": 0.3},
+    {"shape": "box", "min": [0.1, 0.2], "max": [0.7, 0.5]},
+    {"shape": "polygon", "vertices": [[0.1, 0.1], [0.9, 0.2], [0.4, 0.8]]},
+]
+
+
+@pytest.mark.parametrize("method", seeding.METHODS)
+@pytest.mark.parametrize("shape", SHAPES)
+def test_same_seed_gives_same_positions(shape, method):
+    a = seeding.sample(shape, seed=3, method=method, count=500)
+    b = seeding.sample(shape, seed=3, method=method, count=500)
+    np.testing.assert_array_equal(a, b)
+    assert a.shape == (500, 2)
+    assert seeding.contains(shape, a).all()
+
+
+@pytest.mark.parametrize("shape", SHAPES)
+def test_poisson_points_keep_their_distance(shape):
+    spacing = 0.02
+    points = seeding.sample(shape, seed=0, method="poisson", spacing=spacing)
+    diff = points[:, np.newaxis] - points[np.newaxis]
+    dist = np.sqrt((diff**2).sum(axis=-1)) + np.eye(len(points))
+    assert dist.min() >= spacing * seeding.POISSON_RADIUS * (1 - 1e-12)
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+import elasticity_neo_hookean
+import jit
+import only_gravity
+
+SCENES = {"only_gravity": only_gravity, "elasticity": elasticity_neo_hookean}
+
+
+def run(scene, steps=100, **options):
+    # 固定 dt で比べる（適応時間刻みだと dt の丸め誤差の差がステップ数に出る）
+    sim = SCENES[scene].create_simulation(cfl=None, **options)
+    sim.step(steps)
+    return sim
+
+
+@pytest.mark.skipif(not jit.AVAILABLE, reason="numba is not installed")
+@pytest.mark.parametrize("scene, kernel", [("only_gravity", "linear"), ("elasticity", "linear"),
+                                           ("elasticity", "quadratic"), ("elasticity", "cubic")])
+def test_jit_matches_numpy(scene, kernel):
+    a = run(scene, kernel=kernel, backend="numpy", sparse_block_size=None)
+    b = run(scene, kernel=kernel, backend="jit", sparse_block_size=None)
+    np.testing.assert_allclose(b.positions(), a.positions(), atol=1e-12)
+    np.testing.assert_allclose(b.velocities(), a.velocities(), atol=1e-10)
+    np.testing.assert_allclose(b.grid_mass, a.grid_mass, atol=1e-12)
+
+
+@pytest.mark.parametrize("scene", list(SCENES))
+def test_sparse_grid_matches_dense(scene):
+    dense = run(scene, backend="numpy", sparse_block_size=None)
+    sparse = run(scene, backend="numpy", sparse_block_size=8)
+    np.testing.assert_allclose(sparse.positions(), dense.positions(), atol=1e-12)
+    grid_mass, grid_vel = sparse.dense_grid()
+    np.testing.assert_allclose(grid_mass, dense.grid_mass, atol=1e-12)
+    np.testing.assert_allclose(grid_vel, dense.grid_vel, atol=1e-10)
+
+
+def test_auto_backend_keeps_sparse_grid():
+    sim = only_gravity.create_simulation(backend="auto", sparse_block_size=8)
+    assert sim.backend == "numpy" and sim.sparse is not None
+    with pytest.raises(ValueError):
+        only_gravity.create_simulation(backend="jit", sparse_block_size=8)